@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from cachetools import LRUCache
+from fastapi import Header, HTTPException
+
+import helpers
+import metrics
+
+# Get Google OAuth client ID for token verification
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+# Used when Google's response carries no usable Cache-Control header
+DEFAULT_CERTS_MAX_AGE = 300
+
+class CertCache:
+    """Google's token signing certs, refetched only once their Cache-Control max-age has passed."""
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL, clock=time.time):
+        self.url = url
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._certs = None
+        self._expires_at = 0.0
+
+    def get(self, force_refresh: bool = False):
+        with self._lock:
+            if force_refresh or self._certs is None or self._clock() >= self._expires_at:
+                self._certs, max_age = self._fetch()
+                self._expires_at = self._clock() + max_age
+            return self._certs
+
+    def _fetch(self):
+        # google-auth's transport pulls in requests; only paid once a token is first verified
+        from google.auth import exceptions as google_exceptions
+        from google.auth.transport import requests as google_requests
+
+        response = google_requests.Request()(self.url, method="GET")
+        if response.status != 200:
+            raise google_exceptions.TransportError(f"Could not fetch certificates at {self.url}")
+        headers = {k.lower(): v for k, v in response.headers.items()}
+        match = re.search(r"max-age=(\d+)", headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_CERTS_MAX_AGE
+        # the response may already have spent part of its lifetime in a shared cache
+        max_age -= int(headers.get("age", 0) or 0)
+        return json.loads(response.data), max(max_age, 0)
+
+class TokenVerifier:
+    """
+    Verifies Google-issued ID tokens the way id_token.verify_oauth2_token does, but memoizes
+    the verified claims per token (bounded LRU) until the token's own exp.
+    """
+
+    def __init__(self, audience: str = GOOGLE_CLIENT_ID, certs: CertCache = None,
+                 max_entries: int = 1024, clock=time.time):
+        self.audience = audience
+        self.certs = certs or CertCache()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._claims = LRUCache(maxsize=max_entries)
+
+    def _decode(self, token: str, certs):
+        from google.auth import exceptions as google_exceptions
+        from google.auth import jwt
+
+        claims = jwt.decode(token, certs=certs, audience=self.audience)
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise google_exceptions.GoogleAuthError(
+                f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}"
+            )
+        return claims
+
+    def verify(self, token: str):
+        from google.auth import exceptions as google_exceptions
+
+        key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is not None:
+                if claims["exp"] > self._clock():
+                    metrics.cache_lookups.inc("id_token", "hit")
+                    return claims
+                del self._claims[key]
+        metrics.cache_lookups.inc("id_token", "miss")
+
+        with metrics.stage_seconds.time("verify_token"):
+            try:
+                claims = self._decode(token, self.certs.get())
+            except google_exceptions.MalformedError as e:
+                # Google rotated its keys since the certs were cached
+                if "Certificate for key id" not in str(e):
+                    raise
+                claims = self._decode(token, self.certs.get(force_refresh=True))
+
+        with self._lock:
+            self._claims[key] = claims
+        return claims
+
+verifier = TokenVerifier()
+
+def require_claims(authorization: str = Header(None)):
+    """FastAPI dependency: verifies the Bearer ID token and returns its claims."""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid token")
+    token = authorization.split("Bearer ")[1]
+    try:
+        return verifier.verify(token)
+    except Exception as e:
+        helpers.logger.info(f"Rejected ID token: {str(e)}")
+        raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+
+def optional_claims(authorization: str = Header(None)):
+    """FastAPI dependency: the claims of a Bearer ID token when one is sent, else None; a bad token is still a 401."""
+    if not authorization:
+        return None
+    return require_claims(authorization)
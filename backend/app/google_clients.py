@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+import os
+import threading
+
+import helpers
+
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Refresh a little before google-auth would on its own, so only one thread pays for it
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Root URL for every Google API, e.g. the offline benchmark's fake servers (bench/fake_servers.py)
+GOOGLE_API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+
+class GoogleClientPool:
+    """
+    Process-wide Application Default Credentials and built discovery clients.
+    google-auth, httplib2 and the discovery machinery are imported on first use (or by warm()).
+
+    Service objects are built once from the discovery documents bundled with
+    google-api-python-client (static_discovery=True), so no discovery fetch happens at runtime.
+    httplib2 is not thread-safe, so every worker thread executes requests on its own
+    AuthorizedHttp while sharing the credentials and service objects.
+    """
+
+    def __init__(self, scopes=SCOPES, credentials=None, api_endpoint: str = GOOGLE_API_ENDPOINT):
+        self.scopes = scopes
+        self.api_endpoint = api_endpoint
+        self._lock = threading.Lock()
+        # explicit credentials are kept across close(); ADC is re-resolved
+        self._fixed_credentials = credentials
+        self._credentials = credentials
+        self._services = {}
+        self._local = threading.local()
+
+    def _needs_refresh(self):
+        creds = self._credentials
+        if not creds.token:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now < REFRESH_MARGIN
+
+    def credentials(self):
+        """Returns the shared credentials, refreshing the access token only when it is near expiry."""
+        import google.auth
+        import google.auth.transport.requests
+
+        with self._lock:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default(scopes=self.scopes)
+            if self._needs_refresh():
+                helpers.logger.info("Refreshing Google API access token")
+                self._credentials.refresh(google.auth.transport.requests.Request())
+            return self._credentials
+
+    def service(self, name: str, version: str):
+        """Returns the shared discovery client for an API, building it on first use."""
+        from googleapiclient import discovery
+
+        credentials = self.credentials()
+        with self._lock:
+            key = (name, version)
+            if key not in self._services:
+                self._services[key] = discovery.build(
+                    name, version,
+                    credentials=credentials,
+                    static_discovery=True,
+                    cache_discovery=False,
+                    client_options={"api_endpoint": self.api_endpoint} if self.api_endpoint else None,
+                )
+            return self._services[key]
+
+    def iam(self):
+        return self.service("iam", "v1")
+
+    def crm(self):
+        return self.service("cloudresourcemanager", "v1")
+
+    def _http(self):
+        import google_auth_httplib2
+        import httplib2
+
+        credentials = self.credentials()
+        http = getattr(self._local, "http", None)
+        if http is None or http.credentials is not credentials:
+            http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+            self._local.http = http
+        return http
+
+    def execute_sync(self, request):
+        """Executes a googleapiclient HttpRequest on this thread's own connection."""
+        return request.execute(http=self._http())
+
+    async def execute(self, request):
+        """Executes a googleapiclient HttpRequest in a worker thread without blocking the event loop."""
+        return await asyncio.to_thread(self.execute_sync, request)
+
+    def warm(self):
+        """Loads credentials and builds the clients the routes use."""
+        self.iam()
+        self.crm()
+
+    def close(self):
+        """Drops the built clients and cached credentials."""
+        with self._lock:
+            for service in self._services.values():
+                service.close()
+            self._services.clear()
+            self._credentials = self._fixed_credentials
+
+pool = GoogleClientPool()
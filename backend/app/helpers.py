@@ -1,11 +1,17 @@
+import contextlib
+import contextvars
+import json
 import logging
 import os
-import json
+import threading
 
+import llm_providers
+import llm_scheduler
+import metrics
+import model_routing
 import prompts
+import structured_output
 
-from openai import OpenAI
-from groq import Groq
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,37 +19,291 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-openai_client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
-# check for GROQ_API_KEY
-groq_client = Groq()
+# The groq and openai SDKs take a large share of cold-start time, so the clients below are
+# built (and their SDKs imported) on first use, or by warm_llm_clients() during startup.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _build_groq_client():
+    from groq import AsyncGroq
+    # check for GROQ_API_KEY
+    # retries (including 429 backoff) are handled by llm_scheduler so they respect the rate budgets
+    return AsyncGroq(max_retries=0)
+
+def _build_openai_client():
+    # OpenAI is only used as the hedge target, so it is optional
+    if not os.getenv("OPENAI_API_KEY"):
+        return None
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key = os.getenv("OPENAI_API_KEY"))
+
+def _build_llm_router():
+    # Groq answers first; slow tail requests are hedged to OpenAI when it is configured
+    openai_client = _client("openai_client")
+    return llm_providers.HedgedRouter(
+        llm_providers.Provider("groq", _client("groq_client")),
+        llm_providers.Provider("openai", openai_client, model=os.getenv("OPENAI_HEDGE_MODEL", "gpt-4o-mini"))
+        if openai_client else None,
+    )
+
+_CLIENT_BUILDERS = {
+    "groq_client": _build_groq_client,
+    "openai_client": _build_openai_client,
+    "llm_router": _build_llm_router,
+}
+
+def _client(name: str):
+    # built outside the lock (the router's builder asks for the other clients); if two threads
+    # race on first use, only the client stored first is ever handed out
+    if name not in _clients:
+        client = _CLIENT_BUILDERS[name]()
+        with _clients_lock:
+            _clients.setdefault(name, client)
+    return _clients[name]
+
+def __getattr__(name: str):
+    """Keeps helpers.groq_client, helpers.openai_client and helpers.llm_router working, lazily."""
+    if name in _CLIENT_BUILDERS:
+        return _client(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_llm_clients():
+    """Imports the LLM SDKs and builds the clients ahead of the first request."""
+    _client("llm_router")
+
+class TokenUsage:
+    """Running total of LLM token usage for one unit of work."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, usage):
+        self.calls += 1
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def merge(self, other: "TokenUsage"):
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+        }
+
+_usage = contextvars.ContextVar("llm_usage", default=None)
+
+@contextlib.contextmanager
+def track_usage():
+    """Collects the token usage of every LLM call made by the current task inside the block."""
+    usage = TokenUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+def _record_usage(usage, estimated_tokens: int, stage: str):
+    tracker = _usage.get()
+    if tracker is not None:
+        tracker.add(usage)
+    if usage is not None:
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        metrics.llm_tokens.inc(stage, "prompt", amount=prompt_tokens)
+        metrics.llm_tokens.inc(stage, "completion", amount=completion_tokens)
+        llm_scheduler.scheduler.record_usage(estimated_tokens, prompt_tokens + completion_tokens)
+
+async def chat_completion(priority: int = llm_scheduler.PRIORITY_NEW, stage: str = "generate", **kwargs):
+    """Await a Groq chat completion, admitted by the rate-limit-aware scheduler."""
+    estimated_tokens = llm_scheduler.estimate_tokens(kwargs)
+    outcome = "error"
+    try:
+        with metrics.stage_seconds.time(stage):
+            response = await llm_scheduler.scheduler.submit(
+                lambda: _client("llm_router").create(**kwargs), priority, estimated_tokens
+            )
+        outcome = "ok"
+    finally:
+        metrics.llm_requests.inc(stage, outcome)
+    _record_usage(getattr(response, "usage", None), estimated_tokens, stage)
+    return response
+
+async def stream_chat_completion(priority: int = llm_scheduler.PRIORITY_NEW, stage: str = "generate", **kwargs):
+    """Yield the content deltas of a streamed Groq chat completion as they arrive."""
+    estimated_tokens = llm_scheduler.estimate_tokens(kwargs)
+    usage = None
+    outcome = "error"
+    try:
+        with metrics.stage_seconds.time(stage):
+            # the scheduler slot is held until the stream is fully consumed
+            async with llm_scheduler.scheduler.slot(priority, estimated_tokens) as call:
+                stream = await call(lambda: _client("llm_router").create(stream=True, **kwargs))
+                async for chunk in stream:
+                    # Groq reports usage on the final chunk under x_groq
+                    x_groq = getattr(chunk, "x_groq", None)
+                    if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                        usage = x_groq.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+        outcome = "ok"
+    finally:
+        metrics.llm_requests.inc(stage, outcome)
+    _record_usage(usage, estimated_tokens, stage)
+
+def generation_request(prompt: str, examples=()):
+    """
+    Chat completion arguments for the first-pass policy generation.
+    examples are earlier history entries ({"prompt", "policy", "chat_response"}) replayed as
+    user/assistant turns ahead of the prompt, so the model can adapt a close match.
+    """
+    messages = [{"role": "system", "content": prompts.GENERATION_SYSTEM_PROMPT}]
+    for example in examples:
+        messages.append({"role": "user", "content": example["prompt"]})
+        messages.append({"role": "assistant", "content": json.dumps({
+            "policy": json.loads(example["policy"]),
+            "chat_response": example.get("chat_response") or "",
+            "validate": True,
+        })})
+    messages.append({"role": "user", "content": prompt})
+    return dict(
+        messages=messages,
+        response_format={"type": "json_object"},
+        **model_routing.GENERATE.request_args()
+    )
+
+def regeneration_request(prompt: str, feedback: str, original_policy: str, chat_response: str = None):
+    """Chat completion arguments for regenerating a policy with validation feedback."""
+    regeneration_prompt = f"""
+Original request: {prompt}
+
+I generated this policy:
+{original_policy}
+
+Original chat_response: {chat_response or ""}
+
+However, validation identified these issues:
+{feedback}
+
+Please generate an improved policy that addresses these concerns.
+IMPORTANT: Preserve the original chat_response in your response.
+"""
+    return dict(
+        messages=[
+            {"role": "system", "content": prompts.GENERATION_SYSTEM_PROMPT},
+            {"role": "user", "content": regeneration_prompt}
+        ],
+        response_format={"type": "json_object"},
+        **model_routing.REGENERATE.request_args()
+    )
+
+async def _repair_with_model(response_text: str, error: str):
+    """Narrow "fix this JSON" call: far fewer tokens than regenerating the policy."""
+    response = await chat_completion(
+        priority=llm_scheduler.PRIORITY_FOLLOW_UP,
+        stage="repair",
+        messages=[
+            {"role": "system", "content": prompts.JSON_REPAIR_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Parse error: {error}\n\nText to fix:\n{response_text}"}
+        ],
+        response_format={"type": "json_object"},
+        **model_routing.REPAIR.request_args()
+    )
+    return response.choices[0].message.content
 
-async def generate_policy_with_model(prompt: str):
+async def parse_policy_response(response_text: str, stage: str):
+    """
+    Parses (re)generation output against structured_output.GenerationResponse. Malformed output
+    is repaired locally first; only if that fails is a narrow repair call made.
+    A local repair may have closed a truncated policy, so the result is then marked "repaired"
+    and the pipeline has the model validate it whatever the cut-off "validate" flag said.
+    Raises structured_output.OutputError when the output cannot be recovered.
+    """
+    try:
+        parsed, repaired = structured_output.parse(response_text, structured_output.GenerationResponse)
+        result = structured_output.to_dict(parsed)
+        if repaired:
+            metrics.llm_output_repairs.inc(stage, "local")
+            result["repaired"] = True
+        return result
+    except structured_output.OutputError as e:
+        error = str(e)
+    logger.warning(f"Could not repair {stage} output locally, asking the model to fix it: {error}")
+    try:
+        fixed_text = await _repair_with_model(response_text, error)
+        parsed, _ = structured_output.parse(fixed_text, structured_output.GenerationResponse)
+    except structured_output.OutputError:
+        metrics.llm_output_repairs.inc(stage, "failed")
+        raise
+    metrics.llm_output_repairs.inc(stage, "model")
+    return structured_output.to_dict(parsed)
+
+async def parse_generation_response(response_text: str):
+    """Parse the generation model's JSON output, falling back to an apology on unrecoverable output."""
+    try:
+        return await parse_policy_response(response_text, "generate")
+    except structured_output.OutputError as e:
+        logger.error(f"Unrecoverable output from generation model: {str(e)}")
+        return {"chat_response": "I encountered an error generating a valid policy. Please try rephrasing your request.", "error": str(e)}
+
+async def parse_regeneration_response(response_text: str):
+    """Parse the regeneration model's JSON output, falling back to an apology on unrecoverable output."""
+    try:
+        return await parse_policy_response(response_text, "regenerate")
+    except structured_output.OutputError as e:
+        logger.error(f"Unrecoverable output from regeneration model: {str(e)}")
+        return {"chat_response": "I encountered an error regenerating a valid policy based on the feedback.", "error": str(e)}
+
+async def generate_policy_with_model(prompt: str, examples=()):
     """Generate a policy using the first model with JSON mode."""
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": prompts.GENERATION_SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,  # Low temperature for more deterministic outputs
-            response_format={"type": "json_object"}
-        )
+        response = await chat_completion(**generation_request(prompt, examples))
         
         response_text = response.choices[0].message.content
-        logger.info(f"Generated policy response: {response_text[:100]}...")
+        logger.debug("Generated policy response: %.100s...", response_text)
         
         # Parse the JSON response
-        return json.loads(response_text)
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error from generation model: {str(e)}")
-        return {"chat_response": "I encountered an error generating a valid policy. Please try rephrasing your request."}
+        return await parse_generation_response(response_text)
     except Exception as e:
         logger.error(f"Error in generate_policy_with_model: {str(e)}", exc_info=True)
-        return {"chat_response": f"An error occurred: {str(e)}"}
+        return {"chat_response": f"An error occurred: {str(e)}", "error": str(e)}
+
+async def _validate_with(stage_model: model_routing.StageModel, stage: str, validation_prompt: str):
+    response = await chat_completion(
+        priority=llm_scheduler.PRIORITY_FOLLOW_UP,
+        stage=stage,
+        messages=[
+            {"role": "system", "content": prompts.VALIDATION_SYSTEM_PROMPT},
+            {"role": "user", "content": validation_prompt}
+        ],
+        response_format={"type": "json_object"},
+        **stage_model.request_args()
+    )
+
+    response_text = response.choices[0].message.content
+    logger.debug("Validation response (%s): %.100s...", stage_model.model, response_text)
+    # a verdict is short; local repair only, a failure here counts as an unsure validation
+    parsed, repaired = structured_output.parse(response_text, structured_output.ValidationResponse)
+    if repaired:
+        metrics.llm_output_repairs.inc(stage, "local")
+    return structured_output.to_dict(parsed)
 
 async def validate_policy_with_model(policy: str, original_prompt: str, chat_response: str = None):
-    """Validate a policy using the second model with JSON mode."""
+    """
+    Validate a policy using the second model with JSON mode.
+    The fast validation model answers first; unless it confidently passes the policy, the
+    escalation model (when configured) validates again and its verdict is the one returned.
+    """
     try:
         validation_prompt = f"""
 Original request: {original_prompt}
@@ -56,65 +316,75 @@ Original chat_response: {chat_response or ""}
 Please validate this policy against Google Cloud IAM best practices and the principle of least privilege.
 IMPORTANT: Preserve the original chat_response in your response.
 """
-        
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",  # Using the same model for validation
-            messages=[
-                {"role": "system", "content": prompts.VALIDATION_SYSTEM_PROMPT},
-                {"role": "user", "content": validation_prompt}
-            ],
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-        
-        response_text = response.choices[0].message.content
-        logger.info(f"Validation response: {response_text[:100]}...")
-        
-        # Parse the JSON response
-        return json.loads(response_text)
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error from validation model: {str(e)}")
-        return {"valid": False, "feedback": "I encountered an error validating the policy."}
+
+        escalation = model_routing.VALIDATE_ESCALATION
+        try:
+            validation = await _validate_with(model_routing.VALIDATE, "validate", validation_prompt)
+        except Exception as e:
+            if escalation is None:
+                raise
+            logger.warning(f"Validation model failed, escalating: {str(e)}")
+            validation = None
+
+        if escalation is not None and model_routing.should_escalate(validation):
+            metrics.llm_escalations.inc()
+            validation = await _validate_with(escalation, "validate_escalation", validation_prompt)
+        return validation
+    except structured_output.OutputError as e:
+        logger.error(f"Unparseable output from validation model: {str(e)}")
+        return {"valid": False, "feedback": "I encountered an error validating the policy.", "error": str(e)}
     except Exception as e:
         logger.error(f"Error in validate_policy_with_model: {str(e)}", exc_info=True)
-        return {"valid": False, "feedback": f"An error occurred during validation: {str(e)}"}
+        return {"valid": False, "feedback": f"An error occurred during validation: {str(e)}", "error": str(e)}
 
 async def regenerate_policy_with_feedback(prompt: str, feedback: str, original_policy: str, chat_response: str = None):
     """Regenerate a policy with validation feedback."""
     try:
-        regeneration_prompt = f"""
-Original request: {prompt}
-
-I generated this policy:
-{original_policy}
-
-Original chat_response: {chat_response or ""}
-
-However, validation identified these issues:
-{feedback}
-
-Please generate an improved policy that addresses these concerns.
-IMPORTANT: Preserve the original chat_response in your response.
-"""
-        
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": prompts.GENERATION_SYSTEM_PROMPT},
-                {"role": "user", "content": regeneration_prompt}
-            ],
-            temperature=0.1,
-            response_format={"type": "json_object"}
+        response = await chat_completion(
+            priority=llm_scheduler.PRIORITY_FOLLOW_UP,
+            stage="regenerate",
+            **regeneration_request(prompt, feedback, original_policy, chat_response)
         )
         
         response_text = response.choices[0].message.content
-        logger.info(f"Regenerated policy response: {response_text[:100]}...")
+        logger.debug("Regenerated policy response: %.100s...", response_text)
         
         # Parse the JSON response
-        return json.loads(response_text)
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error from regeneration model: {str(e)}")
-        return {"chat_response": "I encountered an error regenerating a valid policy based on the feedback."}
+        return await parse_regeneration_response(response_text)
     except Exception as e:
         logger.error(f"Error in regenerate_policy_with_feedback: {str(e)}", exc_info=True)
-        return {"chat_response": f"An error occurred during regeneration: {str(e)}"}
\ No newline at end of file
+        return {"chat_response": f"An error occurred during regeneration: {str(e)}", "error": str(e)}
+
+async def stream_generate_policy_with_model(prompt: str, examples=()):
+    """Stream a policy generation, yielding ("delta", text) pairs and finally ("response", parsed_json)."""
+    chunks = []
+    try:
+        async for delta in stream_chat_completion(**generation_request(prompt, examples)):
+            chunks.append(delta)
+            yield "delta", delta
+        response_text = "".join(chunks)
+        logger.debug("Generated policy response: %.100s...", response_text)
+        response = await parse_generation_response(response_text)
+    except Exception as e:
+        logger.error(f"Error in stream_generate_policy_with_model: {str(e)}", exc_info=True)
+        response = {"chat_response": f"An error occurred: {str(e)}", "error": str(e)}
+    yield "response", response
+
+async def stream_regenerate_policy_with_feedback(prompt: str, feedback: str, original_policy: str, chat_response: str = None):
+    """Stream a regeneration, yielding ("delta", text) pairs and finally ("response", parsed_json)."""
+    chunks = []
+    try:
+        async for delta in stream_chat_completion(
+            priority=llm_scheduler.PRIORITY_FOLLOW_UP,
+            stage="regenerate",
+            **regeneration_request(prompt, feedback, original_policy, chat_response)
+        ):
+            chunks.append(delta)
+            yield "delta", delta
+        response_text = "".join(chunks)
+        logger.debug("Regenerated policy response: %.100s...", response_text)
+        response = await parse_regeneration_response(response_text)
+    except Exception as e:
+        logger.error(f"Error in stream_regenerate_policy_with_feedback: {str(e)}", exc_info=True)
+        response = {"chat_response": f"An error occurred during regeneration: {str(e)}", "error": str(e)}
+    yield "response", response
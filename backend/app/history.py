@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+import response_cache
+
+# Character shingles survive the small edits users make between variants ("prod" -> "staging SA")
+SHINGLE_SIZE = 4
+# 64 hash functions in 16 bands of 4 rows: prompts sharing ~half their shingles usually meet in a band
+NUM_PERM = 64
+BANDS = 16
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+def shingles(prompt: str) -> set:
+    text = response_cache.normalize_prompt(prompt)
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+class MinHasher:
+    """MinHash signatures over a prompt's shingles; the fraction of equal slots estimates Jaccard similarity."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(num_perm)]
+
+    def signature(self, prompt: str) -> tuple:
+        hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(prompt)]
+        return tuple(min(((a * h + b) % _MERSENNE) & _MAX_HASH for h in hashes) for a, b in self._params)
+
+    @staticmethod
+    def similarity(first, second) -> float:
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+def _band_keys(signature: tuple, bands: int) -> list:
+    """One integer per band: the band number in the high bits, a hash of its rows in the low 32."""
+    rows = len(signature) // bands
+    return [
+        (band << 32) | zlib.crc32(array("I", signature[band * rows:(band + 1) * rows]).tobytes())
+        for band in range(bands)
+    ]
+
+def bindings_key(bindings) -> str:
+    """Identifies a set of bindings regardless of key order, to match an applied policy to its entry."""
+    return hashlib.sha256(json.dumps(bindings, sort_keys=True).encode()).hexdigest()
+
+class HistoryStore:
+    """
+    Persistent prompt -> final policy -> applied projects history in SQLite, with an LSH index over
+    MinHash signatures of the normalized prompts. A lookup reads the 16 band keys of the prompt's
+    signature from an indexed table, then scores only the entries that share a band.
+    Every entry belongs to an owner (the verified token subject) and every read is scoped to one.
+    Calls block on SQLite; async callers run them with asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, bands: int = BANDS, hasher: MinHasher = None,
+                 clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.bands = bands
+        self.hasher = hasher or MinHasher()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        # opened on first use, so importing the app never creates the file
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(
+                """CREATE TABLE IF NOT EXISTS history (
+                       id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       owner TEXT,
+                       created_at REAL NOT NULL,
+                       prompt TEXT NOT NULL,
+                       normalized TEXT NOT NULL,
+                       policy TEXT NOT NULL,
+                       chat_response TEXT,
+                       bindings_key TEXT NOT NULL,
+                       signature BLOB NOT NULL
+                   );
+                   CREATE TABLE IF NOT EXISTS history_lsh (
+                       band_key INTEGER NOT NULL,
+                       entry_id INTEGER NOT NULL REFERENCES history (id) ON DELETE CASCADE
+                   );
+                   CREATE INDEX IF NOT EXISTS history_lsh_band ON history_lsh (band_key);
+                   CREATE INDEX IF NOT EXISTS history_lsh_entry ON history_lsh (entry_id);
+                   CREATE TABLE IF NOT EXISTS history_applies (
+                       entry_id INTEGER NOT NULL REFERENCES history (id) ON DELETE CASCADE,
+                       project_id TEXT NOT NULL,
+                       applied_at REAL NOT NULL
+                   );
+                   CREATE INDEX IF NOT EXISTS history_applies_entry ON history_applies (entry_id);"""
+            )
+            # files written before entries had owners; their rows have none and match no one
+            if "owner" not in {row[1] for row in conn.execute("PRAGMA table_info(history)")}:
+                conn.execute("ALTER TABLE history ADD COLUMN owner TEXT")
+            conn.executescript(
+                """CREATE INDEX IF NOT EXISTS history_owner ON history (owner, id);
+                   CREATE INDEX IF NOT EXISTS history_owner_normalized ON history (owner, normalized);
+                   CREATE INDEX IF NOT EXISTS history_owner_bindings ON history (owner, bindings_key);"""
+            )
+            self._conn = conn
+        return self._conn
+
+    def record(self, owner: str, prompt: str, policy: str, chat_response: str = None) -> int:
+        """Stores a final policy (the pretty-printed JSON string the pipeline returns); returns its id."""
+        signature = self.hasher.signature(prompt)
+        bindings = json.loads(policy).get("bindings", [])
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                entry_id = db.execute(
+                    """INSERT INTO history (owner, created_at, prompt, normalized, policy, chat_response, bindings_key, signature)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (owner, self._clock(), prompt, response_cache.normalize_prompt(prompt), policy, chat_response,
+                     bindings_key(bindings), array("I", signature).tobytes()),
+                ).lastrowid
+                db.executemany(
+                    "INSERT INTO history_lsh (band_key, entry_id) VALUES (?, ?)",
+                    [(key, entry_id) for key in _band_keys(signature, self.bands)],
+                )
+                # oldest entries beyond the size bound go, along with their index rows and applies
+                db.execute(
+                    "DELETE FROM history WHERE id IN (SELECT id FROM history ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return entry_id
+
+    def mark_applied(self, owner: str, project_id: str, bindings: list, history_id: int = None):
+        """
+        Records that a policy was applied to a project. The entry is owner's history_id when given,
+        otherwise owner's latest entry with the same bindings. Returns the entry id, or None when no
+        entry matches.
+        """
+        with self._lock:
+            db = self._db()
+            if history_id is not None:
+                row = db.execute("SELECT id FROM history WHERE id = ? AND owner = ?", (history_id, owner)).fetchone()
+            else:
+                row = db.execute(
+                    "SELECT id FROM history WHERE owner = ? AND bindings_key = ? ORDER BY id DESC LIMIT 1",
+                    (owner, bindings_key(bindings)),
+                ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "INSERT INTO history_applies (entry_id, project_id, applied_at) VALUES (?, ?, ?)",
+                (row[0], project_id, self._clock()),
+            )
+        return row[0]
+
+    def similar(self, owner: str, prompt: str, limit: int = 5, threshold: float = 0.0) -> list:
+        """owner's entries whose prompts resemble prompt, most similar first, each with its estimated "similarity"."""
+        signature = self.hasher.signature(prompt)
+        keys = _band_keys(signature, self.bands)
+        with self._lock:
+            db = self._db()
+            candidates = db.execute(
+                f"""SELECT id, signature FROM history WHERE owner = ? AND id IN (
+                        SELECT entry_id FROM history_lsh WHERE band_key IN ({",".join("?" * len(keys))})
+                    )""",
+                [owner, *keys],
+            ).fetchall()
+            scored = []
+            for entry_id, blob in candidates:
+                score = MinHasher.similarity(signature, array("I", blob))
+                if score >= threshold:
+                    scored.append((score, entry_id))
+            scored.sort(reverse=True)
+            scored = scored[:limit]
+            entries = self._entries(db, [entry_id for _, entry_id in scored])
+        return [{**entries[entry_id], "similarity": round(score, 3)} for score, entry_id in scored]
+
+    def latest_applied(self, owner: str, prompt: str):
+        """owner's newest entry for the same normalized prompt that was applied to a project, or None."""
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                """SELECT id FROM history WHERE owner = ? AND normalized = ?
+                   AND EXISTS (SELECT 1 FROM history_applies WHERE entry_id = history.id)
+                   ORDER BY id DESC LIMIT 1""",
+                (owner, response_cache.normalize_prompt(prompt)),
+            ).fetchone()
+            return self._entries(db, [row[0]])[row[0]] if row else None
+
+    def page(self, owner: str, cursor: str = None, limit: int = 20):
+        """
+        Returns (entries, next_cursor, total) for owner, newest first. The cursor is the id to continue
+        below, so pages stay stable while new entries are recorded; None when exhausted.
+        """
+        with self._lock:
+            db = self._db()
+            total = db.execute("SELECT COUNT(*) FROM history WHERE owner = ?", (owner,)).fetchone()[0]
+            ids = [row[0] for row in db.execute(
+                "SELECT id FROM history WHERE owner = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (owner, int(cursor) if cursor else 1 << 62, limit + 1),
+            )]
+            next_cursor = str(ids[limit - 1]) if len(ids) > limit else None
+            ids = ids[:limit]
+            entries = self._entries(db, ids)
+        return [entries[entry_id] for entry_id in ids], next_cursor, total
+
+    def _entries(self, db, ids: list) -> dict:
+        if not ids:
+            return {}
+        marks = ",".join("?" * len(ids))
+        entries = {
+            row[0]: {
+                "id": row[0], "created_at": row[1], "prompt": row[2],
+                "policy": row[3], "chat_response": row[4], "applied_to": [],
+            }
+            for row in db.execute(
+                f"SELECT id, created_at, prompt, policy, chat_response FROM history WHERE id IN ({marks})", ids
+            )
+        }
+        for entry_id, project_id, applied_at in db.execute(
+            f"SELECT entry_id, project_id, applied_at FROM history_applies WHERE entry_id IN ({marks}) ORDER BY applied_at",
+            ids,
+        ):
+            entries[entry_id]["applied_to"].append({"project_id": project_id, "applied_at": applied_at})
+        return entries
+
+    def clear(self):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM history")
+
+    def __len__(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+# Entries at least this similar to a new prompt are shown to the generation model as a worked example
+HISTORY_FEW_SHOT_THRESHOLD = float(os.getenv("HISTORY_FEW_SHOT_THRESHOLD", "0.6"))
+# Reuse an applied policy outright when the same (normalized) prompt comes in again
+HISTORY_REUSE_APPLIED = os.getenv("HISTORY_REUSE_APPLIED", "true").lower() == "true"
+
+def create_history_store():
+    """Builds the store configured by the HISTORY_* environment variables."""
+    return HistoryStore(
+        os.getenv("HISTORY_PATH", "generation_history.sqlite3"),
+        max_entries=int(os.getenv("HISTORY_MAX_ENTRIES", "10000")),
+    )
+
+store = create_history_store()
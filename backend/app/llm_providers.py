@@ -0,0 +1,131 @@
+import asyncio
+import collections
+import math
+import os
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+
+# hedge settings are read at import time, before helpers has loaded .env
+load_dotenv()
+
+# Percentile of the primary's recent latencies after which the request is hedged
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Hedge delay bounds, and the delay used until enough latencies have been observed
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "10"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3"))
+HEDGE_MIN_SAMPLES = 20
+
+hedged_total = metrics.Counter(
+    "gatekeeper_llm_hedged_total", "Completions hedged to the secondary provider.", ["provider"]
+)
+hedge_wins_total = metrics.Counter(
+    "gatekeeper_llm_hedge_wins_total", "Hedged completions, by the provider that answered first.", ["provider"]
+)
+
+class LatencyHistogram:
+    """Sliding window of recent call latencies with percentile lookup."""
+
+    def __init__(self, size: int = 500):
+        self._samples = collections.deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float):
+        """Nearest-rank percentile of the window, or None when it is empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+        return ordered[rank - 1]
+
+class Provider:
+    """
+    An OpenAI-compatible chat completions client, optionally pinned to its own model name.
+    Latencies are kept per requested model, i.e. per pipeline stage: a 1k-token validation and a
+    full generation have very different tails.
+    """
+
+    def __init__(self, name: str, client, model: str = None):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.latencies = collections.defaultdict(LatencyHistogram)
+        self.wins = 0
+
+    def latency(self, model: str) -> LatencyHistogram:
+        return self.latencies[model]
+
+    async def create(self, **kwargs):
+        window = self.latency(kwargs.get("model"))
+        if self.model:
+            kwargs = {**kwargs, "model": self.model}
+        start = time.perf_counter()
+        # a cancelled call (a lost hedge race) propagates without a sample: it only ever ran up to
+        # the hedge delay, and recording it would drag the percentile down to the delay itself
+        response = await self.client.chat.completions.create(**kwargs)
+        window.observe(time.perf_counter() - start)
+        return response
+
+class HedgedRouter:
+    """
+    Sends each completion to the primary provider and, if it has not answered within the hedge
+    delay, sends the same request to the secondary. The first successful answer wins and the
+    other call is cancelled. The delay tracks the primary's latency percentile for the requested
+    model, so only the slow tail of each stage is hedged. Without a secondary, or for streamed completions, only the primary is used.
+    """
+
+    def __init__(self, primary: Provider, secondary: Provider = None,
+                 percentile: float = LLM_HEDGE_PERCENTILE, min_delay: float = LLM_HEDGE_MIN_DELAY,
+                 max_delay: float = LLM_HEDGE_MAX_DELAY, default_delay: float = LLM_HEDGE_DEFAULT_DELAY):
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.hedged = 0
+
+    def hedge_delay(self, model: str = None) -> float:
+        latency = self.primary.latency(model)
+        if len(latency) < HEDGE_MIN_SAMPLES:
+            return self.default_delay
+        delay = latency.percentile(self.percentile)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    async def create(self, **kwargs):
+        if self.secondary is None or kwargs.get("stream"):
+            return await self.primary.client.chat.completions.create(**kwargs)
+
+        primary = asyncio.create_task(self.primary.create(**kwargs))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(kwargs.get("model")))
+            if done:
+                self.primary.wins += 1
+                return primary.result()
+
+            self.hedged += 1
+            hedged_total.inc(self.secondary.name)
+            secondary = asyncio.create_task(self.secondary.create(**kwargs))
+            pending.add(secondary)
+            winners = {primary: self.primary, secondary: self.secondary}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winners[task].wins += 1
+                        hedge_wins_total.inc(winners[task].name)
+                        return task.result()
+            # both failed; the primary's error is the one callers know how to handle
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
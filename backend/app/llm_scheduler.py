@@ -0,0 +1,223 @@
+import asyncio
+import contextlib
+import functools
+import heapq
+import itertools
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+
+# limits are read at import time, before helpers has loaded .env
+load_dotenv()
+
+# Work that finishes requests already in flight (validation, regeneration) runs before new generations
+PRIORITY_FOLLOW_UP = 0
+PRIORITY_NEW = 1
+# Calls re-queued after a failure already hold a concurrency slot and go ahead of everything else
+_PRIORITY_RETRY = -1
+
+# Requests-per-minute and tokens-per-minute budgets for the Groq key; 0 disables a budget
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+# Maximum number of in-flight LLM calls per worker; extra calls queue by priority
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# How many times a call is re-queued after a 429 or transient failure before the error is surfaced
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+# Completion tokens assumed when a request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1024
+MAX_BACKOFF_SECONDS = 30.0
+
+# 429s pause the whole queue; connection errors and 5xx only delay the failing call.
+# The Groq client is built with max_retries=0 so these are retried here, within the budgets.
+@functools.lru_cache(maxsize=None)
+def retryable_errors():
+    """Groq errors worth retrying; groq is only imported once a call has actually failed."""
+    import groq
+    return (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)
+
+def estimate_tokens(request: dict) -> int:
+    """Rough token cost of a chat completion: ~4 characters per prompt token plus the completion budget."""
+    prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+    return prompt_chars // 4 + (request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+def retry_after_seconds(error: Exception):
+    """The server's retry-after hint on a rate-limit error, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class TokenBucket:
+    """Refills continuously up to capacity over one minute. A capacity of 0 never limits."""
+
+    def __init__(self, capacity_per_minute: int, clock=time.monotonic):
+        self.capacity = capacity_per_minute
+        self._clock = clock
+        self._tokens = float(capacity_per_minute)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be consumed (requests larger than capacity wait for a full bucket)."""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self._tokens
+        return max(0.0, missing * 60.0 / self.capacity)
+
+    def consume(self, amount: float):
+        """Takes amount from the bucket; negative amounts return tokens. May go into debt."""
+        if self.capacity:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+class LLMScheduler:
+    """
+    Single admission point for every Groq chat completion in this worker.
+
+    Calls wait in a priority queue until the concurrency cap, the RPM/TPM token buckets and any
+    429 cool-down all allow them through. A 429 pauses admission for the server's retry-after
+    (or an exponential backoff) plus jitter, and the call is re-queued instead of failing.
+    """
+
+    def __init__(self, rpm: int = LLM_RPM_LIMIT, tpm: int = LLM_TPM_LIMIT,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 clock=time.monotonic):
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sequence = itertools.count()
+        self._loop = None
+        self.rate_limited = 0
+
+    def _state(self):
+        # asyncio primitives belong to one event loop; start fresh if we are running on another
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self._waiting = []
+            self._active = 0
+            self._cooldown_until = 0.0
+        return self._condition
+
+    @property
+    def in_flight(self) -> int:
+        return getattr(self, "_active", 0)
+
+    @property
+    def queued(self) -> int:
+        return len(getattr(self, "_waiting", ()))
+
+    def _admission_delay(self, estimated_tokens: int) -> float:
+        return max(
+            self._cooldown_until - self._clock(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(estimated_tokens),
+        )
+
+    async def _admit(self, priority: int, estimated_tokens: int, take_slot: bool):
+        condition = self._state()
+        async with condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    if self._waiting[0] == entry and (not take_slot or self._active < self.max_concurrency):
+                        delay = self._admission_delay(estimated_tokens)
+                        if delay <= 0:
+                            break
+                        # sleep until the budget refills, waking early if the queue changes
+                        with contextlib.suppress(asyncio.TimeoutError):
+                            await asyncio.wait_for(condition.wait(), timeout=delay)
+                    else:
+                        await condition.wait()
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                condition.notify_all()
+                raise
+
+            heapq.heappop(self._waiting)
+            self.requests.consume(1)
+            self.tokens.consume(estimated_tokens)
+            if take_slot:
+                self._active += 1
+            condition.notify_all()
+
+    async def _release(self):
+        condition = self._state()
+        async with condition:
+            self._active -= 1
+            condition.notify_all()
+
+    def _back_off(self, error: Exception, attempt: int) -> float:
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(MAX_BACKOFF_SECONDS, 2.0 ** attempt)
+        # jitter keeps queued calls from hitting the API in lockstep when the pause ends
+        delay += random.uniform(0, 0.25 * delay + 0.1)
+        import groq
+        if isinstance(error, groq.RateLimitError):
+            # the limit is per API key, so every queued call waits out the pause
+            self.rate_limited += 1
+            rate_limited_total.inc()
+            self._cooldown_until = max(self._cooldown_until, self._clock() + delay)
+            return 0.0
+        return delay
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int, estimated_tokens: int):
+        """
+        Holds one unit of LLM concurrency for the duration of the block, e.g. while a
+        streamed completion is consumed. Yields a function that runs a call with 429 retries.
+        """
+        await self._admit(priority, estimated_tokens, take_slot=True)
+        try:
+            async def call(fn):
+                for attempt in itertools.count():
+                    try:
+                        return await fn()
+                    except retryable_errors() as e:
+                        if attempt >= self.max_retries:
+                            raise
+                        await asyncio.sleep(self._back_off(e, attempt))
+                        # wait for the cool-down (and budget) while keeping our concurrency slot
+                        await self._admit(_PRIORITY_RETRY, estimated_tokens, take_slot=False)
+            yield call
+        finally:
+            await self._release()
+
+    async def submit(self, fn, priority: int, estimated_tokens: int):
+        """Runs fn() (a coroutine function making one LLM call) once admitted, retrying 429s."""
+        async with self.slot(priority, estimated_tokens) as call:
+            return await call(fn)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Corrects the TPM bucket once a call's real token usage is known."""
+        self.tokens.consume(actual_tokens - estimated_tokens)
+
+scheduler = LLMScheduler()
+
+rate_limited_total = metrics.Counter(
+    "gatekeeper_llm_rate_limited_total", "LLM calls that were answered with a 429 and re-queued."
+)
+metrics.CallbackGauge("gatekeeper_llm_calls_in_flight", "LLM calls admitted and not yet finished.",
+                      lambda: scheduler.in_flight)
+metrics.CallbackGauge("gatekeeper_llm_calls_queued", "LLM calls waiting for admission.",
+                      lambda: scheduler.queued)
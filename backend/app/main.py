@@ -1,16 +1,47 @@
+import startup  # first, so the startup report's clock covers every other import
+
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+startup.report.mark("fastapi")
 
 from routes import router
+import auth
+import google_clients
+import helpers
+import metrics
+startup.report.mark("routes")
 
 # Load environment variables from .env file
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warms the shared clients in the background and releases them on shutdown.
+    Requests are served right away; anything not warmed yet is built on first use, and /ready
+    answers 200 once the warm-up has finished. The startup report is logged at that point.
+    """
+    warm_up = asyncio.create_task(startup.report.run_warm_up({
+        # a failure here (e.g. missing ADC) must not keep the LLM routes from serving
+        "google_clients": google_clients.pool.warm,
+        "llm_clients": helpers.warm_llm_clients,
+        "id_token_certs": auth.verifier.certs.get,
+    }))
+    yield
+    warm_up.cancel()
+    google_clients.pool.close()
+
 # Initialize FastAPI application
-app = FastAPI(title="Google Cloud IAM Policy Generator")
+app = FastAPI(title="Google Cloud IAM Policy Generator", lifespan=lifespan)
 app.include_router(router)
 
+# Per-route latency and in-flight counts; the route list bounds the label set
+app.add_middleware(metrics.MetricsMiddleware, routes=[route.path for route in router.routes])
+
 # Configure CORS middleware to allow requests from specified origins
 app.add_middleware(
     CORSMiddleware,
@@ -18,4 +49,6 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
-)
\ No newline at end of file
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # /get_projects and /history paging
+)
+startup.report.mark("app")
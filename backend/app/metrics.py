@@ -0,0 +1,184 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# Latency buckets in seconds, from cache hits up to slow LLM chains
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """Monotonic counter. Labels are passed positionally in labelnames order."""
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for labels, value in self._series.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        return Counter.render(self)
+
+class CallbackGauge(_Metric):
+    """Gauge whose value is read from a callable at scrape time; costs nothing on the hot path."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback):
+        super().__init__(name, help_text)
+        self._callback = callback
+
+    def render(self):
+        return self._header() + [f"{self.name} {self._callback()}"]
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; observe() is a bisect and three additions."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        """Observes the wall time of the with-block, including awaits inside it."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for labels, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = bound if bound == "+Inf" else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+stage_seconds = Histogram(
+    "gatekeeper_stage_duration_seconds",
+    "Latency of each pipeline stage and upstream call.",
+    ["stage"],
+)
+llm_tokens = Counter(
+    "gatekeeper_llm_tokens_total",
+    "LLM tokens used, by pipeline stage and token kind (prompt or completion).",
+    ["stage", "kind"],
+)
+llm_requests = Counter(
+    "gatekeeper_llm_requests_total",
+    "LLM chat completions, by pipeline stage and outcome.",
+    ["stage", "outcome"],
+)
+llm_escalations = Counter(
+    "gatekeeper_llm_validation_escalations_total",
+    "Validations re-run on the escalation model because the fast model was unsure or rejected the policy.",
+)
+llm_output_repairs = Counter(
+    "gatekeeper_llm_output_repairs_total",
+    "Malformed model output, by stage and how it was recovered (local, model) or not (failed).",
+    ["stage", "method"],
+)
+least_privilege_replacements = Counter(
+    "gatekeeper_least_privilege_replacements_total",
+    "Over-broad roles in generated policies replaced with narrower roles from the bundled catalog.",
+    ["role"],
+)
+cache_lookups = Counter(
+    "gatekeeper_cache_lookups_total",
+    "Cache lookups, by cache and result (hit, miss, or stale for stale-while-revalidate).",
+    ["cache", "result"],
+)
+http_in_flight = Gauge(
+    "gatekeeper_http_requests_in_flight",
+    "HTTP requests currently being served, by route.",
+    ["route"],
+)
+http_seconds = Histogram(
+    "gatekeeper_http_request_duration_seconds",
+    "HTTP request latency until the response body is fully sent, by route.",
+    ["route"],
+)
+
+class MetricsMiddleware:
+    """ASGI middleware tracking in-flight requests and latency per known route path."""
+
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.routes = frozenset(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # unknown paths share one label so scanners cannot blow up the series count
+        route = scope["path"] if scope["path"] in self.routes else "other"
+        http_in_flight.inc(route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            http_in_flight.dec(route)
+            http_seconds.observe(time.perf_counter() - start, route)
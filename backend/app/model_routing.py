@@ -0,0 +1,66 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# stage settings are read at import time, possibly before helpers has loaded .env
+load_dotenv()
+
+# Large model for the stages that write policies
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+# Validation mostly answers yes/no with short feedback, so a small fast model handles it first
+DEFAULT_VALIDATE_MODEL = "llama-3.1-8b-instant"
+
+@dataclass(frozen=True)
+class StageModel:
+    """Model and sampling settings for one pipeline stage."""
+    model: str
+    temperature: float = 0.1
+    max_tokens: Optional[int] = None
+
+    def request_args(self) -> dict:
+        args = {"model": self.model, "temperature": self.temperature}
+        if self.max_tokens:
+            args["max_tokens"] = self.max_tokens
+        return args
+
+def stage_from_env(stage: str, model: str, temperature: float = 0.1, max_tokens: Optional[int] = None):
+    """Reads LLM_<STAGE>_MODEL, LLM_<STAGE>_TEMPERATURE and LLM_<STAGE>_MAX_TOKENS, falling back to the defaults given."""
+    prefix = f"LLM_{stage.upper()}_"
+    max_tokens = os.getenv(prefix + "MAX_TOKENS", max_tokens)
+    return StageModel(
+        model=os.getenv(prefix + "MODEL", model),
+        temperature=float(os.getenv(prefix + "TEMPERATURE", temperature)),
+        max_tokens=int(max_tokens) if max_tokens else None,
+    )
+
+GENERATE = stage_from_env("generate", DEFAULT_MODEL)
+VALIDATE = stage_from_env("validate", DEFAULT_VALIDATE_MODEL, max_tokens=1024)
+REGENERATE = stage_from_env("regenerate", DEFAULT_MODEL)
+# Narrow "fix this JSON" call for output that local repair could not parse
+REPAIR = stage_from_env("repair", DEFAULT_VALIDATE_MODEL, temperature=0.0)
+# Second opinion when the validation model is unsure or rejects the policy; empty disables escalation
+VALIDATE_ESCALATION = stage_from_env("validate_escalation", DEFAULT_MODEL)
+if VALIDATE_ESCALATION.model in ("", VALIDATE.model):
+    VALIDATE_ESCALATION = None
+# Self-reported confidence below which a passing validation is still escalated
+VALIDATE_MIN_CONFIDENCE = float(os.getenv("LLM_VALIDATE_MIN_CONFIDENCE", "0.8"))
+
+def should_escalate(validation: Optional[dict]) -> bool:
+    """
+    True unless the validation model confidently passed the policy. Failures, unparseable answers
+    and low-confidence passes all go to the escalation model, so a policy is never rejected (and
+    regenerated) on the small model's word alone.
+    """
+    if not isinstance(validation, dict) or validation.get("valid") is not True:
+        return True
+    confidence = validation.get("confidence")
+    if isinstance(confidence, (int, float)) and not isinstance(confidence, bool):
+        return confidence < VALIDATE_MIN_CONFIDENCE
+    return False
+
+def routing_key() -> str:
+    """Identifies the models that produce a cached answer; changes whenever the routing does."""
+    stages = [GENERATE, VALIDATE, REGENERATE, VALIDATE_ESCALATION]
+    return "|".join(stage.model if stage else "-" for stage in stages)
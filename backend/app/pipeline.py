@@ -0,0 +1,275 @@
+import asyncio
+import json
+
+import helpers
+import history
+import metrics
+import policy_checker
+import response_cache
+import role_catalog
+import single_flight
+
+async def _generate(prompt: str, stream: bool, examples=()):
+    """Yields ("token", ...) events when streaming, then ("generated", response)."""
+    if not stream:
+        yield "generated", await helpers.generate_policy_with_model(prompt, examples)
+        return
+    async for kind, value in helpers.stream_generate_policy_with_model(prompt, examples):
+        if kind == "delta":
+            yield "token", {"stage": "generate", "delta": value}
+        else:
+            yield "generated", value
+
+async def _regenerate(prompt: str, feedback: str, policy: str, chat_response: str, stream: bool):
+    """Yields ("token", ...) events when streaming, then ("generated", response)."""
+    if not stream:
+        yield "generated", await helpers.regenerate_policy_with_feedback(prompt, feedback, policy, chat_response)
+        return
+    async for kind, value in helpers.stream_regenerate_policy_with_feedback(prompt, feedback, policy, chat_response):
+        if kind == "delta":
+            yield "token", {"stage": "regenerate", "delta": value}
+        else:
+            yield "generated", value
+
+def _narrow(policy_json, prompt: str, chat_response):
+    """Swaps over-broad roles for catalog roles covering the prompt; returns (policy_json, chat_response, replacements)."""
+    with metrics.stage_seconds.time("least_privilege"):
+        policy_json, replacements = role_catalog.narrow_policy(policy_json, prompt)
+    if replacements:
+        note = "\n".join(
+            f"Replaced {item['role']} with {', '.join(item['replacements'])}, which covers the requested access."
+            for item in replacements
+        )
+        chat_response = f"{chat_response}\n\n{note}" if chat_response else note
+    return policy_json, chat_response, replacements
+
+async def _history_match(prompt: str, owner):
+    """
+    Returns (entry, reused) from owner's history: the newest applied entry for the same prompt to
+    replay as is, else the closest similar entry to use as a few-shot example, else (None, False).
+    Anonymous requests have no history. History is best effort.
+    """
+    if owner is None:
+        return None, False
+    try:
+        if history.HISTORY_REUSE_APPLIED:
+            entry = await asyncio.to_thread(history.store.latest_applied, owner, prompt)
+            if entry is not None:
+                return {**entry, "similarity": 1.0}, True
+        matches = await asyncio.to_thread(
+            history.store.similar, owner, prompt, limit=1, threshold=history.HISTORY_FEW_SHOT_THRESHOLD
+        )
+    except Exception as e:
+        helpers.logger.warning(f"History lookup failed: {str(e)}")
+        return None, False
+    return (matches[0], False) if matches else (None, False)
+
+async def _record_history(prompt: str, owner, result: dict):
+    """
+    Stores a policy that passed validation in owner's history; returns its history id, or None when
+    the request is anonymous, the policy was not validated, or storing failed.
+    """
+    if owner is None or not result["policy"] or result["valid"] is not True or result["error"]:
+        return None
+    try:
+        return await asyncio.to_thread(history.store.record, owner, prompt, result["policy"], result["chat_response"])
+    except Exception as e:
+        helpers.logger.warning(f"Failed to record generation history: {str(e)}")
+        return None
+
+async def policy_pipeline_events(prompt: str, stream: bool = False, owner: str = None):
+    """
+    Runs the generate -> validate -> regenerate chain for a single prompt, yielding (event, data)
+    pairs as each stage produces output. owner is the signed-in user's subject; their history
+    supplies reuse and few-shot examples and records the validated result.
+      history_match -> {"id", "prompt", "similarity", "applied_to", "reused"} closest earlier generation:
+                      reused as the result when the same prompt was applied before, else a few-shot example
+      token        -> {"stage", "delta"} model output as it arrives (stream=True only)
+      draft        -> {"policy", "chat_response"} first-pass policy before validation
+      least_privilege -> {"policy", "replacements"} over-broad draft roles swapped for narrower catalog roles;
+                      the rewritten policy always goes to the validation model
+      local_check  -> {"valid", "errors", "warnings"} in-process checker verdict (valid is None when inconclusive)
+      validating   -> {} the validation model has been called
+      validation   -> {"valid", "feedback", "source"} final verdict, from "local" checks or the "model"
+      regenerating -> {} the generator is being re-run with the feedback
+      result       -> {"policy", "chat_response", "history_id", "valid", "error"} final response, always the last event
+    """
+    with metrics.stage_seconds.time("history_lookup"):
+        match, reused = await _history_match(prompt, owner)
+    examples = ()
+    if match is not None:
+        yield "history_match", {
+            "id": match["id"],
+            "prompt": match["prompt"],
+            "similarity": match["similarity"],
+            "applied_to": match["applied_to"],
+            "reused": reused,
+        }
+        if reused:
+            helpers.logger.info(f"Reusing applied policy from history entry {match['id']}")
+            yield "result", {
+                "policy": match["policy"],
+                "chat_response": match["chat_response"],
+                "history_id": match["id"],
+                "valid": True,
+                "error": None,
+            }
+            return
+        examples = (match,)
+
+    # First model call: Generate policy with JSON mode
+    helpers.logger.info("Making initial call to policy generation model")
+    async for event, data in _generate(prompt, stream, examples):
+        if event == "generated":
+            generation_response = data
+        else:
+            yield event, data
+
+    # Extract policy and chat response from generation model
+    policy_json = None
+    chat_response = None
+    validated = False
+    # valid: True once validation passes, False when it failed (a regenerated policy is not re-checked),
+    # None when the model asked for no validation; error names the stage that raised, if any
+    valid = None
+    error = "generate" if generation_response.get("error") else None
+    # locally repaired output may be a truncated policy closed up, so it is always validated
+    repaired = generation_response.get("repaired", False)
+
+    if "policy" in generation_response:
+        policy_json = generation_response["policy"]
+        validated = generation_response.get("validate", False) or repaired
+
+    if "chat_response" in generation_response:
+        chat_response = generation_response["chat_response"]
+
+    policy = json.dumps(policy_json, indent=2) if policy_json else None
+    yield "draft", {"policy": policy, "chat_response": chat_response}
+
+    # Narrow over-broad roles before validation; the validation model always reviews the rewrite
+    policy_json, chat_response, replacements = _narrow(policy_json, prompt, chat_response)
+    if replacements:
+        policy = json.dumps(policy_json, indent=2)
+        yield "least_privilege", {"policy": policy, "replacements": replacements}
+
+    # If a policy was generated and should be validated
+    validation_feedback = None
+    if policy and (validated or replacements):
+        # Deterministic checks first; the validation model only sees what they cannot settle
+        with metrics.stage_seconds.time("local_check"):
+            verdict = policy_checker.check_policy(policy_json)
+        yield "local_check", verdict.to_dict()
+
+        # a rewrite by the keyword heuristic or a repaired draft is never settled locally: only a failure is conclusive
+        if verdict.conclusive and not ((replacements or repaired) and verdict.valid):
+            helpers.logger.info(f"Local policy check was conclusive: valid={verdict.valid}")
+            validation_result = {"valid": verdict.valid}
+            if not verdict.valid:
+                validation_result["feedback"] = verdict.feedback()
+            source = "local"
+        else:
+            helpers.logger.info("Policy generated, validating with second model")
+            yield "validating", {}
+            validation_result = await helpers.validate_policy_with_model(policy, prompt, chat_response)
+            if not validation_result.get("valid", False):
+                # Give the regeneration the exact local findings alongside the model's feedback
+                model_feedback = validation_result.get("feedback") or ""
+                validation_result["feedback"] = f"{model_feedback}\n{verdict.feedback()}".strip()
+            source = "model"
+
+        valid = bool(validation_result.get("valid", False))
+        if validation_result.get("error"):
+            error = "validate"
+        yield "validation", {
+            "valid": valid,
+            "feedback": validation_result.get("feedback"),
+            "source": source,
+        }
+
+        # Preserve the chat_response from validation result if it exists
+        if "chat_response" in validation_result:
+            chat_response = validation_result["chat_response"]
+
+        # If policy is invalid, send feedback to generation model
+        if not validation_result.get("valid", False):
+            validation_feedback = validation_result.get("feedback", "")
+            helpers.logger.info(f"Validation failed, regenerating with feedback: {validation_feedback[:50]}...")
+            yield "regenerating", {}
+
+            # Second generation with validation feedback
+            async for event, data in _regenerate(prompt, validation_feedback, policy, chat_response, stream):
+                if event == "generated":
+                    regeneration_response = data
+                else:
+                    yield event, data
+
+            if regeneration_response.get("error"):
+                error = error or "regenerate"
+
+            # Update policy and chat response with regenerated values
+            if "policy" in regeneration_response:
+                policy_json = regeneration_response["policy"]
+                policy = json.dumps(policy_json, indent=2)
+
+            if "chat_response" in regeneration_response:
+                chat_response = regeneration_response["chat_response"]
+
+                # Add validation feedback if not already included
+                if validation_feedback and validation_feedback not in chat_response:
+                    if chat_response:
+                        chat_response = f"{chat_response}\n\nValidation feedback: {validation_feedback}"
+                    else:
+                        chat_response = f"Validation feedback: {validation_feedback}"
+
+    result = {"policy": policy, "chat_response": chat_response, "history_id": None, "valid": valid, "error": error}
+    result["history_id"] = await _record_history(prompt, owner, result)
+    yield "result", result
+
+def is_cacheable(result: dict) -> bool:
+    """
+    Only policies worth replaying: ones that passed validation. Clarifying questions, unvalidated
+    or failed policies and anything produced while a stage errored are not.
+    """
+    return result.get("policy") is not None and not result.get("error") and result.get("valid") is True
+
+async def run_policy_pipeline(prompt: str, owner: str = None):
+    """
+    Runs the generate -> validate -> regenerate chain for a single prompt.
+    Returns a dict with the final "policy" (pretty-printed JSON string or None), "chat_response",
+    the "history_id" the policy was recorded under, and the outcome: "valid" (True, False, or None
+    when no validation ran) and "error" (the stage that raised, or None).
+    """
+    async for event, data in policy_pipeline_events(prompt, owner=owner):
+        if event == "result":
+            return data
+
+# Identical prompts submitted at the same time share one pipeline run
+_generate_flight = single_flight.SingleFlight("generate_policy")
+
+async def cache_result(prompt: str, result: dict, owner: str = None):
+    """
+    Caches a cacheable result under owner's key, since it may be built from owner's history;
+    anonymous results share one entry per prompt.
+    """
+    if is_cacheable(result):
+        await response_cache.policy_cache.set_async(prompt, {**result, "history_id": None}, owner)
+
+async def _run_and_cache(prompt: str, owner):
+    result = await run_policy_pipeline(prompt, owner)
+    await cache_result(prompt, result, owner)
+    return result
+
+async def generate_policy_cached(prompt: str, owner: str = None):
+    """
+    Answers a prompt from owner's response cache, or runs the pipeline and caches a cacheable result.
+    Concurrent misses for the same normalized prompt and owner wait on a single pipeline run.
+    Returns (result, cached).
+    """
+    cached = await response_cache.policy_cache.get_async(prompt, owner)
+    if cached is not None:
+        helpers.logger.info("Returning cached policy response")
+        return cached, True
+
+    key = response_cache.policy_cache.key(prompt, owner)
+    result = await _generate_flight.do(key, lambda: _run_and_cache(prompt, owner))
+    return result, False
@@ -0,0 +1,191 @@
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# Predefined role names bundled with the app; refresh from `gcloud iam roles list --format=json`
+PREDEFINED_ROLES = frozenset(json.loads((DATA_DIR / "predefined_roles.json").read_text())["roles"])
+
+MEMBER_PREFIXES = ("user:", "serviceAccount:", "group:", "domain:")
+PUBLIC_MEMBERS = ("allUsers", "allAuthenticatedUsers")
+PRIMITIVE_ROLES = ("roles/owner", "roles/editor", "roles/viewer")
+
+_CUSTOM_ROLE = re.compile(r"^(projects|organizations)/[^/]+/roles/[A-Za-z0-9_.]+$")
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_DOMAIN = re.compile(r"^[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+$")
+
+@dataclass
+class Verdict:
+    """
+    Result of the local policy check.
+    errors make the policy conclusively invalid; warnings need the model's judgement;
+    a policy with neither is conclusively valid.
+    """
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    @property
+    def conclusive(self) -> bool:
+        return bool(self.errors) or not self.warnings
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def feedback(self) -> str:
+        return "\n".join(f"- {issue}" for issue in self.errors + self.warnings)
+
+    def to_dict(self):
+        return {
+            "valid": self.valid if self.conclusive else None,
+            "errors": self.errors,
+            "warnings": self.warnings,
+        }
+
+# Roles that administer or own resources, or let the holder act with more privilege than they were
+# granted (impersonating service accounts, running builds as a service account, logging into VMs as
+# root, editing IAM, deleting or moving projects). Their names do not follow one pattern, so they are
+# listed; the name-suffix test below only catches admin and owner roles missing here.
+SENSITIVE_ROLES = frozenset({
+    "roles/owner",
+    "roles/resourcemanager.projectIamAdmin",
+    "roles/resourcemanager.folderAdmin",
+    "roles/resourcemanager.folderIamAdmin",
+    "roles/resourcemanager.organizationAdmin",
+    "roles/resourcemanager.projectDeleter",
+    "roles/resourcemanager.projectMover",
+    "roles/iam.securityAdmin",
+    "roles/iam.roleAdmin",
+    "roles/iam.organizationRoleAdmin",
+    "roles/iam.serviceAccountAdmin",
+    "roles/iam.serviceAccountKeyAdmin",
+    "roles/iam.serviceAccountCreator",
+    "roles/iam.serviceAccountDeleter",
+    "roles/iam.serviceAccountUser",
+    "roles/iam.serviceAccountTokenCreator",
+    "roles/iam.serviceAccountOpenIdTokenCreator",
+    "roles/iam.workloadIdentityUser",
+    "roles/iam.workloadIdentityPoolAdmin",
+    "roles/compute.admin",
+    "roles/compute.instanceAdmin",
+    "roles/compute.instanceAdmin.v1",
+    "roles/compute.osAdminLogin",
+    "roles/container.admin",
+    "roles/container.clusterAdmin",
+    "roles/container.developer",
+    "roles/run.admin",
+    "roles/cloudfunctions.admin",
+    "roles/cloudfunctions.developer",
+    "roles/cloudbuild.builds.editor",
+    "roles/cloudbuild.builds.builder",
+    "roles/cloudbuild.workerPoolOwner",
+    "roles/composer.admin",
+    "roles/dataproc.editor",
+    "roles/appengine.appAdmin",
+    "roles/secretmanager.admin",
+    "roles/storage.admin",
+    "roles/storage.legacyBucketOwner",
+    "roles/storage.legacyObjectOwner",
+    "roles/bigquery.dataOwner",
+    "roles/datastore.owner",
+    "roles/cloudasset.owner",
+    "roles/certificatemanager.owner",
+    "roles/cloudsql.admin",
+    "roles/cloudkms.admin",
+    "roles/billing.admin",
+    "roles/orgpolicy.policyAdmin",
+    "roles/accesscontextmanager.policyAdmin",
+    "roles/serviceusage.serviceUsageAdmin",
+})
+
+def is_sensitive_role(role: str) -> bool:
+    return role in SENSITIVE_ROLES or role.endswith((".admin", "Admin", ".owner", "Owner"))
+
+def _check_member(member, role: str, where: str, verdict: Verdict):
+    if not isinstance(member, str):
+        verdict.errors.append(f"{where}: member {member!r} must be a string")
+        return
+    if member in PUBLIC_MEMBERS:
+        if role in PRIMITIVE_ROLES or is_sensitive_role(role):
+            verdict.errors.append(f"{where}: {role} must not be granted to {member}")
+        else:
+            verdict.warnings.append(f"{where}: {member} makes {role} public")
+        return
+    if not member.startswith(MEMBER_PREFIXES):
+        verdict.errors.append(
+            f"{where}: member '{member}' must start with one of {', '.join(MEMBER_PREFIXES)}"
+        )
+        return
+
+    prefix, identifier = member.split(":", 1)
+    if prefix == "domain":
+        if not _DOMAIN.match(identifier):
+            verdict.errors.append(f"{where}: '{identifier}' is not a valid domain")
+        else:
+            verdict.warnings.append(f"{where}: {member} grants {role} to every account in the domain")
+    elif not _EMAIL.match(identifier):
+        verdict.errors.append(f"{where}: '{identifier}' is not a valid email for {prefix}:")
+    elif prefix == "serviceAccount" and not identifier.endswith(".gserviceaccount.com"):
+        verdict.errors.append(f"{where}: service account '{identifier}' must end in .gserviceaccount.com")
+
+def _check_role(role, where: str, verdict: Verdict):
+    if not isinstance(role, str) or not role:
+        verdict.errors.append(f"{where}: missing role")
+        return False
+    if _CUSTOM_ROLE.match(role):
+        verdict.warnings.append(f"{where}: custom role {role} cannot be checked locally")
+        return True
+    if not role.startswith("roles/"):
+        verdict.errors.append(f"{where}: role '{role}' must start with 'roles/' or be a custom role path")
+        return False
+    if role not in PREDEFINED_ROLES:
+        verdict.warnings.append(f"{where}: {role} is not in the bundled predefined-role catalog")
+    elif role in PRIMITIVE_ROLES:
+        verdict.warnings.append(f"{where}: primitive role {role} grants broad access across the project")
+    elif is_sensitive_role(role):
+        verdict.warnings.append(f"{where}: {role} is an administrative or privilege-escalation role")
+    return True
+
+def _check_condition(condition, where: str, verdict: Verdict):
+    if not isinstance(condition, dict):
+        verdict.errors.append(f"{where}: condition must be an object")
+        return
+    for key in ("title", "expression"):
+        if not isinstance(condition.get(key), str) or not condition[key].strip():
+            verdict.errors.append(f"{where}: condition is missing '{key}'")
+
+def check_policy(policy) -> Verdict:
+    """
+    Deterministic structural and risk checks for a generated IAM policy.
+    Runs in-process before (and often instead of) the validation model.
+    """
+    verdict = Verdict()
+    if not isinstance(policy, dict):
+        verdict.errors.append("policy must be a JSON object")
+        return verdict
+    bindings = policy.get("bindings")
+    if not isinstance(bindings, list) or not bindings:
+        verdict.errors.append("policy must contain a non-empty 'bindings' list")
+        return verdict
+
+    for i, binding in enumerate(bindings):
+        where = f"bindings[{i}]"
+        if not isinstance(binding, dict):
+            verdict.errors.append(f"{where}: binding must be an object")
+            continue
+        role = binding.get("role")
+        role_ok = _check_role(role, where, verdict)
+
+        members = binding.get("members")
+        if not isinstance(members, list) or not members:
+            verdict.errors.append(f"{where}: 'members' must be a non-empty list")
+        elif role_ok:
+            for member in members:
+                _check_member(member, role, where, verdict)
+
+        if "condition" in binding:
+            _check_condition(binding["condition"], where, verdict)
+
+    return verdict
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+
+from cachetools import TTLCache
+
+import google_clients
+import metrics
+
+# Upper bound on concurrent lintPolicy calls for a single policy
+LINT_MAX_PARALLEL = int(os.getenv("LINT_MAX_PARALLEL", "8"))
+
+# Lint results depend only on (resource, condition), so unchanged conditions are not re-linted
+_lint_cache = TTLCache(
+    maxsize=int(os.getenv("LINT_CACHE_MAX_ENTRIES", "4096")),
+    ttl=float(os.getenv("LINT_CACHE_TTL_SECONDS", "3600")),
+)
+_lint_cache_lock = threading.Lock()
+
+def lint_key(full_resource_name: str, condition: dict) -> str:
+    """Stable hash of a (resource, condition) pair."""
+    raw = json.dumps([full_resource_name, condition], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def _lint_condition(full_resource_name: str, condition: dict, semaphore: asyncio.Semaphore):
+    key = lint_key(full_resource_name, condition)
+    with _lint_cache_lock:
+        cached = _lint_cache.get(key)
+    if cached is not None:
+        metrics.cache_lookups.inc("lint", "hit")
+        return cached
+    metrics.cache_lookups.inc("lint", "miss")
+
+    lint_body = {
+        "fullResourceName": full_resource_name,
+        "condition": condition,
+    }
+    async with semaphore:
+        iam_service = google_clients.pool.iam()
+        with metrics.stage_seconds.time("lint_policy"):
+            lint_resp = await google_clients.pool.execute(iam_service.iamPolicies().lintPolicy(body=lint_body))
+
+    lint_results = lint_resp.get("lintResults", [])
+    with _lint_cache_lock:
+        _lint_cache[key] = lint_results
+    return lint_results
+
+async def lint_bindings(full_resource_name: str, bindings: list):
+    """
+    Lints the condition of every conditional binding concurrently (at most LINT_MAX_PARALLEL
+    calls in flight) and returns all lint results in binding order.
+    Any lintPolicy failure is raised to the caller.
+    """
+    conditions = {}
+    for binding in bindings:
+        condition = binding.get("condition")
+        if condition:                                   # nothing to lint otherwise
+            conditions.setdefault(lint_key(full_resource_name, condition), condition)
+
+    semaphore = asyncio.Semaphore(LINT_MAX_PARALLEL)
+    results = await asyncio.gather(
+        *(_lint_condition(full_resource_name, condition, semaphore) for condition in conditions.values())
+    )
+    return [issue for lint_results in results for issue in lint_results]
+
+def format_lint_issues(lint_issues: list) -> str:
+    """Compact human-readable string expected by the frontend."""
+    return " | ".join(
+        f"[{r.get('severity')}] {r.get('debugMessage')} (field: {r.get('fieldName')})"
+        for r in lint_issues
+    )
+
+def clear_cache():
+    with _lint_cache_lock:
+        _lint_cache.clear()
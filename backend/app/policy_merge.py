@@ -0,0 +1,148 @@
+import copy
+import json
+import logging
+import os
+
+from googleapiclient.errors import HttpError
+
+# Standalone logger so the merge engine can be imported without the LLM clients
+logger = logging.getLogger(__name__)
+
+# Re-read/re-merge/retry rounds when setIamPolicy reports a concurrent change (etag mismatch)
+SET_POLICY_MAX_ATTEMPTS = int(os.getenv("SET_POLICY_MAX_ATTEMPTS", "3"))
+
+# Conditional role bindings are only accepted in (and returned by) version 3 policies
+CONDITIONAL_POLICY_VERSION = 3
+
+def condition_key(condition):
+    """Canonical form of a binding condition; None for unconditional bindings."""
+    if not condition:
+        return None
+    return json.dumps(condition, sort_keys=True, separators=(",", ":"))
+
+def binding_key(binding: dict):
+    """Bindings are identified by (role, condition): the same role under different conditions is a different grant."""
+    return binding.get("role"), condition_key(binding.get("condition"))
+
+class MergeResult:
+    """Merged policy plus the minimal diff against the policy it was merged into."""
+
+    def __init__(self, policy: dict, added: list, unchanged: list, conflicting: list = None):
+        self.policy = policy
+        # {"role", "condition"?, "members"} holding only the members that were not already granted
+        self.added = added
+        # requested bindings whose members were all already granted
+        self.unchanged = unchanged
+        # {"role", "condition"?, "members", "existing_condition"}: requested members that already hold
+        # the role under a different condition (or none), so the new grant widens or duplicates it
+        self.conflicting = conflicting or []
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added)
+
+    def diff(self):
+        return {"added": self.added, "unchanged": self.unchanged, "conflicting": self.conflicting}
+
+def merge_policy(current_policy: dict, new_bindings: list) -> MergeResult:
+    """
+    Merges new bindings into an existing policy without removing anything.
+    Bindings are indexed by (role, condition), so each new binding is an O(1) lookup and
+    conditional grants are never folded into unconditional ones. Existing members keep their
+    order and new members are appended in request order.
+    Members that already hold a requested role under another condition are still granted, and are
+    reported in MergeResult.conflicting.
+    The input policy is not modified: bindings are copied shallowly and a member list is only
+    copied when members are added to it.
+    """
+    policy = dict(current_policy)
+    bindings = policy["bindings"] = [dict(binding) for binding in current_policy.get("bindings", [])]
+
+    index = {}
+    for binding in bindings:
+        index.setdefault(binding_key(binding), binding)
+    member_sets = {}
+    # original bindings by role, for the conflict check
+    by_role = {}
+    for binding in current_policy.get("bindings", []):
+        by_role.setdefault(binding.get("role"), []).append(binding)
+
+    added = []
+    unchanged = []
+    conflicting = []
+    for new_binding in new_bindings:
+        key = binding_key(new_binding)
+        requested = set(new_binding.get("members", []))
+        for existing in by_role.get(key[0], ()):
+            if condition_key(existing.get("condition")) == key[1]:
+                continue
+            overlap = [member for member in existing.get("members", []) if member in requested]
+            if overlap:
+                conflict = {"role": key[0], "members": overlap, "existing_condition": existing.get("condition")}
+                if new_binding.get("condition"):
+                    conflict["condition"] = new_binding["condition"]
+                conflicting.append(conflict)
+        target = index.get(key)
+        if target is None:
+            target = {"role": new_binding.get("role"), "members": []}
+            if new_binding.get("condition"):
+                target["condition"] = copy.deepcopy(new_binding["condition"])
+            bindings.append(target)
+            index[key] = target
+
+        seen = member_sets.get(key)
+        if seen is None:
+            target["members"] = list(target.get("members", []))
+            seen = member_sets[key] = set(target["members"])
+
+        new_members = []
+        for member in new_binding.get("members", []):
+            if member not in seen:
+                seen.add(member)
+                new_members.append(member)
+
+        if new_members:
+            target["members"].extend(new_members)
+            diff_entry = {"role": target["role"], "members": new_members}
+            if "condition" in target:
+                diff_entry["condition"] = target["condition"]
+            added.append(diff_entry)
+        else:
+            unchanged.append(new_binding)
+
+    if any("condition" in binding for binding in bindings):
+        policy["version"] = CONDITIONAL_POLICY_VERSION
+
+    return MergeResult(policy, added, unchanged, conflicting)
+
+async def apply_with_retry(new_bindings: list, get_policy, set_policy, max_attempts: int = None,
+                           get_cached_policy=None):
+    """
+    Reads the current policy, merges new_bindings into it and writes it back.
+    When setIamPolicy rejects the write because the etag is stale (409), the policy is re-read
+    and re-merged, up to max_attempts times. No write happens when the merge changes nothing.
+    get_policy() and set_policy(policy) are coroutines supplied by the caller. When
+    get_cached_policy() is given it supplies the first read: a stale copy is caught by the etag
+    check on write, and a no-op merge against it is confirmed with get_policy() before returning.
+    Returns (resulting policy, MergeResult).
+    """
+    max_attempts = max_attempts or SET_POLICY_MAX_ATTEMPTS
+    read = get_cached_policy or get_policy
+    attempt = 0
+    while True:
+        current_policy = await read()
+        result = merge_policy(current_policy, new_bindings)
+        if not result.changed:
+            if read is get_policy:
+                return current_policy, result
+            # a cached copy may be missing grants that were removed since; check the live policy
+            read = get_policy
+            continue
+        attempt += 1
+        try:
+            return await set_policy(result.policy), result
+        except HttpError as err:
+            if err.resp.status != 409 or attempt == max_attempts:
+                raise
+            logger.info(f"setIamPolicy etag conflict, retrying merge (attempt {attempt + 1}/{max_attempts})")
+            read = get_policy
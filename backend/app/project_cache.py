@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+
+from cachetools import LRUCache
+
+import helpers
+import metrics
+import project_iam
+
+# Listings younger than this are served as-is
+PROJECT_CACHE_TTL_SECONDS = float(os.getenv("PROJECT_CACHE_TTL_SECONDS", "300"))
+# Older listings, up to this age, are served immediately while a background refresh runs
+PROJECT_CACHE_STALE_SECONDS = float(os.getenv("PROJECT_CACHE_STALE_SECONDS", "3600"))
+PROJECT_CACHE_MAX_USERS = int(os.getenv("PROJECT_CACHE_MAX_USERS", "1024"))
+
+class ProjectIndex:
+    """One user's project listing with a lowercase search key per project."""
+
+    def __init__(self, projects: list, fetched_at: float):
+        self.projects = projects
+        self.fetched_at = fetched_at
+        self._search_keys = [f"{p['id']}\x00{p['name']}".lower() for p in projects]
+
+    def page(self, cursor: str = None, limit: int = None, query: str = None):
+        """
+        Returns (projects, next_cursor, total) for projects whose id or name contains query.
+        The cursor is the opaque offset returned by the previous page; None when exhausted.
+        """
+        if query:
+            needle = query.lower()
+            matches = [p for p, key in zip(self.projects, self._search_keys) if needle in key]
+        else:
+            matches = self.projects
+
+        start = int(cursor) if cursor else 0
+        end = len(matches) if limit is None else start + limit
+        next_cursor = str(end) if end < len(matches) else None
+        return matches[start:end], next_cursor, len(matches)
+
+class ProjectCache:
+    """
+    Per-user project listings with a TTL and stale-while-revalidate refresh.
+    Concurrent misses for the same user share a single enumeration, which a cancelled caller
+    leaves running for the rest.
+    """
+
+    def __init__(self, fetch=None, ttl: float = PROJECT_CACHE_TTL_SECONDS,
+                 stale_ttl: float = PROJECT_CACHE_STALE_SECONDS, max_users: int = PROJECT_CACHE_MAX_USERS,
+                 clock=time.monotonic):
+        # defaults to listing through project_iam, looked up per call
+        self._fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._entries = LRUCache(maxsize=max_users)
+        self._inflight = {}
+
+    async def get(self, user_key: str, force_refresh: bool = False) -> ProjectIndex:
+        entry = self._entries.get(user_key)
+        if entry is not None and not force_refresh:
+            age = self._clock() - entry.fetched_at
+            if age < self.ttl:
+                metrics.cache_lookups.inc("projects", "hit")
+                return entry
+            if age < self.stale_ttl:
+                metrics.cache_lookups.inc("projects", "stale")
+                self._refresh(user_key)
+                return entry
+        metrics.cache_lookups.inc("projects", "miss")
+        # shielded: one caller going away must not cancel the listing the others are waiting on
+        return await asyncio.shield(self._refresh(user_key))
+
+    def _refresh(self, user_key: str) -> asyncio.Task:
+        task = self._inflight.get(user_key)
+        if task is None:
+            task = asyncio.create_task(self._load(user_key))
+            self._inflight[user_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_key, None))
+            # a failed background refresh keeps serving the stale listing; log instead of warning about an unretrieved exception
+            task.add_done_callback(self._log_failure)
+        return task
+
+    async def _load(self, user_key: str) -> ProjectIndex:
+        projects = await (self._fetch or project_iam.list_projects)()
+        entry = ProjectIndex(projects, self._clock())
+        self._entries[user_key] = entry
+        helpers.logger.info(f"Cached {len(projects)} projects")
+        return entry
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            helpers.logger.warning(f"Project listing refresh failed: {task.exception()}")
+
+    def clear(self):
+        self._entries.clear()
+
+project_cache = ProjectCache()
@@ -0,0 +1,107 @@
+import os
+import threading
+
+from cachetools import TTLCache
+
+import google_clients
+import metrics
+import policy_merge
+import single_flight
+
+# Last known IAM policy per project. Every write carries the policy's etag, so a stale copy is
+# rejected by setIamPolicy (409) rather than silently overwriting someone else's change.
+_policy_cache = TTLCache(
+    maxsize=int(os.getenv("IAM_POLICY_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("IAM_POLICY_CACHE_TTL_SECONDS", "60")),
+)
+_policy_cache_lock = threading.Lock()
+# Concurrent reads of one project's policy share a single getIamPolicy call
+_policy_reads = single_flight.SingleFlight("get_iam_policy")
+
+def _remember(project_id: str, policy: dict):
+    with _policy_cache_lock:
+        _policy_cache[project_id] = policy
+    return policy
+
+async def _fetch_project_policy(project_id: str):
+    crm_service = google_clients.pool.crm()
+    with metrics.stage_seconds.time("get_iam_policy"):
+        policy = await google_clients.pool.execute(crm_service.projects().getIamPolicy(
+            resource=project_id,
+            body={"options": {"requestedPolicyVersion": policy_merge.CONDITIONAL_POLICY_VERSION}},
+        ))
+    return _remember(project_id, policy)
+
+async def get_project_policy(project_id: str):
+    """
+    Fetches a project's IAM policy, including any conditional bindings.
+    Callers that arrive while a fetch for the project is in flight share its result.
+    """
+    return await _policy_reads.do(project_id, lambda: _fetch_project_policy(project_id))
+
+async def get_cached_project_policy(project_id: str):
+    """The project's last known IAM policy if it was fetched or written recently, else a fresh fetch."""
+    with _policy_cache_lock:
+        policy = _policy_cache.get(project_id)
+    if policy is not None:
+        metrics.cache_lookups.inc("iam_policy", "hit")
+        return policy
+    metrics.cache_lookups.inc("iam_policy", "miss")
+    return await get_project_policy(project_id)
+
+async def set_project_policy(project_id: str, policy: dict):
+    """Writes a project's IAM policy; fails with a 409 HttpError if its etag is stale."""
+    crm_service = google_clients.pool.crm()
+    with metrics.stage_seconds.time("set_iam_policy"):
+        updated = await google_clients.pool.execute(crm_service.projects().setIamPolicy(
+            resource=project_id,
+            body={"policy": policy},
+        ))
+    # the response is the stored policy with its new etag
+    return _remember(project_id, updated)
+
+def clear_policy_cache():
+    with _policy_cache_lock:
+        _policy_cache.clear()
+
+async def preview_bindings(project_id: str, new_bindings: list):
+    """
+    Dry run of apply_bindings: merges against the (possibly cached) current policy without writing.
+    Returns (current policy, policy_merge.MergeResult).
+    """
+    current_policy = await get_cached_project_policy(project_id)
+    return current_policy, policy_merge.merge_policy(current_policy, new_bindings)
+
+async def apply_bindings(project_id: str, new_bindings: list):
+    """
+    Merges new bindings into a project's IAM policy, retrying on etag conflicts.
+    The first read reuses the policy cached by a recent preview; its etag guards the write.
+    Returns (resulting policy, policy_merge.MergeResult).
+    """
+    # DO NOT OVERWRITE EXISTING BINDINGS, GRAB THE EXISTING ONES FIRST AND MERGE THEM
+    # YOU WILL BRICK THE PROJECT
+    return await policy_merge.apply_with_retry(
+        new_bindings,
+        lambda: get_project_policy(project_id),
+        lambda policy: set_project_policy(project_id, policy),
+        get_cached_policy=lambda: get_cached_project_policy(project_id),
+    )
+
+async def list_projects():
+    """Lists every project visible to the service's credentials, walking all pages."""
+    # Use the shared Application Default Credentials client
+    # Instead of trying to use the ID token as OAuth credentials
+    crm_service = google_clients.pool.crm()
+
+    # Make the list request to get all projects the user has access to
+    request = crm_service.projects().list()
+    projects = []
+
+    # Handle pagination by fetching all pages of results
+    with metrics.stage_seconds.time("list_projects"):
+        while request is not None:
+            response = await google_clients.pool.execute(request)
+            projects.extend([{"id": project["projectId"], "name": project["name"]} for project in response.get("projects", [])])
+            request = crm_service.projects().list_next(previous_request=request, previous_response=response)
+
+    return projects
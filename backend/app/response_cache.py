@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from cachetools import TTLCache
+
+import metrics
+import model_routing
+import prompts
+
+# Changes whenever either system prompt is edited, so stale answers are never served
+PROMPT_VERSION = hashlib.sha256(
+    (prompts.GENERATION_SYSTEM_PROMPT + prompts.VALIDATION_SYSTEM_PROMPT).encode()
+).hexdigest()[:12]
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variations share a key."""
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip(".!?")
+
+class MemoryBackend:
+    """In-process LRU with a per-entry TTL."""
+
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl_seconds: float, timer=time.monotonic):
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl_seconds, timer=timer)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+class SQLiteBackend:
+    """On-disk LRU with a per-entry TTL, shared by every worker that points at the same file."""
+
+    # calls wait on SQLite (and on other workers' writes), so async callers run them in a thread
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS policy_cache (
+                   key TEXT PRIMARY KEY,
+                   value TEXT NOT NULL,
+                   expires_at REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS policy_cache_lru ON policy_cache (last_access)")
+
+    def get(self, key: str):
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM policy_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM policy_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE policy_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO policy_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl_seconds, now),
+            )
+            # Drop expired rows first, then the least recently used ones over the size bound
+            self._conn.execute("DELETE FROM policy_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                """DELETE FROM policy_cache WHERE key IN (
+                       SELECT key FROM policy_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM policy_cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM policy_cache").fetchone()[0]
+
+class PolicyResponseCache:
+    """
+    Caches the final validated {policy, chat_response} for a prompt.
+    Keys combine the normalized prompt, the per-stage models and the system-prompt version, plus
+    the owner for signed-in requests: their answers can draw on the owner's private history.
+    """
+
+    def __init__(self, backend, model: str = model_routing.routing_key(), prompt_version: str = PROMPT_VERSION):
+        self.backend = backend
+        self.model = model
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, prompt: str, owner: str = None) -> str:
+        raw = f"{self.model}\x00{self.prompt_version}\x00{normalize_prompt(prompt)}"
+        if owner is not None:
+            raw += f"\x00{owner}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, prompt: str, owner: str = None):
+        value = self.backend.get(self.key(prompt, owner))
+        if value is None:
+            self.misses += 1
+            metrics.cache_lookups.inc("policy_response", "miss")
+        else:
+            self.hits += 1
+            metrics.cache_lookups.inc("policy_response", "hit")
+        return value
+
+    def set(self, prompt: str, value: dict, owner: str = None):
+        self.backend.set(self.key(prompt, owner), value)
+
+    async def get_async(self, prompt: str, owner: str = None):
+        """get for async callers: off the event loop when the backend blocks."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.get, prompt, owner)
+        return self.get(prompt, owner)
+
+    async def set_async(self, prompt: str, value: dict, owner: str = None):
+        """set for async callers: off the event loop when the backend blocks."""
+        if self.backend.blocking:
+            await asyncio.to_thread(self.set, prompt, value, owner)
+        else:
+            self.set(prompt, value, owner)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.backend),
+        }
+
+def create_policy_cache():
+    """Builds the cache configured by the POLICY_CACHE_* environment variables."""
+    max_entries = int(os.getenv("POLICY_CACHE_MAX_ENTRIES", "1024"))
+    ttl_seconds = float(os.getenv("POLICY_CACHE_TTL_SECONDS", "86400"))
+    if os.getenv("POLICY_CACHE_BACKEND", "memory").lower() == "sqlite":
+        path = os.getenv("POLICY_CACHE_PATH", "policy_cache.sqlite3")
+        backend = SQLiteBackend(path, max_entries, ttl_seconds)
+    else:
+        backend = MemoryBackend(max_entries, ttl_seconds)
+    return PolicyResponseCache(backend)
+
+policy_cache = create_policy_cache()
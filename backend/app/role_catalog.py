@@ -0,0 +1,332 @@
+import json
+import re
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import metrics
+import policy_checker
+
+# Predefined role -> included permissions. "permissions" is an interned table and each role lists
+# indices into it. The bundled file covers the roles the generator commonly reaches for (plus the
+# primitive roles over that set); regenerate it from the IAM API with
+# `python role_catalog.py > data/role_permissions.json` using application default credentials.
+CATALOG_PATH = policy_checker.DATA_DIR / "role_permissions.json"
+
+@dataclass(frozen=True)
+class OverGrant:
+    """How a role compares to the permissions a binding actually needs."""
+    role: str
+    granted: int                # permissions the role grants
+    needed: int                 # permissions asked for
+    missing: tuple = ()         # needed permissions the role does not grant
+
+    @property
+    def excess(self) -> int:
+        return self.granted - (self.needed - len(self.missing))
+
+class RoleCatalog:
+    """
+    Role permissions as bitsets (plain ints) over the interned permission table, plus the reverse
+    index: for every permission, a bitset of the roles that grant it. Roles are numbered smallest
+    first, so the lowest set bit of a role bitset is the smallest role in it.
+    """
+
+    def __init__(self, permissions: list, roles: dict):
+        self.permissions = list(permissions)
+        self.index = {name: i for i, name in enumerate(self.permissions)}
+        ordered = sorted(roles.items(), key=lambda item: (len(item[1]), item[0]))
+        self.roles = [name for name, _ in ordered]
+        self.masks = {}
+        self._holders = [0] * len(self.permissions)
+        for r, (name, granted) in enumerate(ordered):
+            mask = 0
+            for permission in granted:
+                i = permission if isinstance(permission, int) else self.index[permission]
+                mask |= 1 << i
+                self._holders[i] |= 1 << r
+            self.masks[name] = mask
+        self._all_roles = (1 << len(self.roles)) - 1
+
+    @classmethod
+    def load(cls, path: Path):
+        doc = json.loads(Path(path).read_text())
+        return cls(doc["permissions"], doc["roles"])
+
+    def __contains__(self, role) -> bool:
+        return role in self.masks
+
+    def mask(self, permissions) -> int:
+        """Bitset of permissions; raises KeyError for a permission the catalog does not know."""
+        mask = 0
+        for permission in permissions:
+            mask |= 1 << self.index[permission]
+        return mask
+
+    def names(self, mask: int) -> list:
+        """Permission names in a bitset."""
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self.permissions[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+    def covering_roles(self, permissions) -> list:
+        """Every role granting all of permissions, smallest first."""
+        roles = self._covering(permissions)
+        found = []
+        while roles:
+            low = roles & -roles
+            found.append(self.roles[low.bit_length() - 1])
+            roles ^= low
+        return found
+
+    def smallest_covering_role(self, permissions):
+        """The role granting all of permissions with the fewest permissions overall, or None."""
+        roles = self._covering(permissions)
+        return self.roles[(roles & -roles).bit_length() - 1] if roles else None
+
+    def _covering(self, permissions) -> int:
+        roles = self._all_roles
+        for permission in permissions:
+            i = self.index.get(permission)
+            if i is None:
+                return 0
+            roles &= self._holders[i]
+            if not roles:
+                break
+        return roles
+
+    def over_grant(self, role: str, permissions) -> OverGrant:
+        """Raises KeyError for a role the catalog does not know."""
+        granted = self.masks[role]
+        permissions = set(permissions)
+        missing = tuple(sorted(p for p in permissions if p not in self.index or not granted >> self.index[p] & 1))
+        return OverGrant(role, granted.bit_count(), len(permissions), missing)
+
+    def narrower(self, role: str, permissions):
+        """
+        Roles that together grant permissions and strictly less than role does: whichever of the
+        smallest covering role, the smallest covering role per service, or a greedy cover grants
+        least. None when role is unknown, does not grant permissions itself, or nothing narrower
+        covers them.
+        """
+        role_mask = self.masks.get(role)
+        if role_mask is None or not permissions:
+            return None
+        try:
+            if self.mask(permissions) & ~role_mask:
+                return None
+        except KeyError:
+            return None
+
+        by_service = {}
+        for permission in permissions:
+            by_service.setdefault(permission.split(".", 1)[0], []).append(permission)
+        candidates = [
+            [self.smallest_covering_role(permissions)],
+            [self.smallest_covering_role(group) for _, group in sorted(by_service.items())],
+            self._greedy_cover(self.mask(permissions)),
+        ]
+
+        best = best_mask = None
+        for roles in candidates:
+            if None in roles:
+                continue
+            roles = list(dict.fromkeys(roles))
+            mask = 0
+            for name in roles:
+                mask |= self.masks[name]
+            # a replacement may only take permissions away
+            if mask & ~role_mask or mask == role_mask:
+                continue
+            if best is None or mask.bit_count() < best_mask.bit_count():
+                best, best_mask = roles, mask
+        return best
+
+    def _greedy_cover(self, needed: int) -> list:
+        """Repeatedly takes the role with the fewest permissions per newly covered one."""
+        roles = []
+        while needed:
+            holders = 0
+            for permission in self.names(needed):
+                holders |= self._holders[self.index[permission]]
+            best = best_cost = None
+            while holders:
+                low = holders & -holders
+                name = self.roles[low.bit_length() - 1]
+                cost = self.masks[name].bit_count() / (self.masks[name] & needed).bit_count()
+                if best is None or cost < best_cost:
+                    best, best_cost = name, cost
+                holders ^= low
+            roles.append(best)
+            needed &= ~self.masks[best]
+        return roles
+
+@lru_cache(maxsize=None)
+def catalog() -> RoleCatalog:
+    return RoleCatalog.load(CATALOG_PATH)
+
+def is_over_broad(role: str) -> bool:
+    return role in policy_checker.PRIMITIVE_ROLES or policy_checker.is_sensitive_role(role)
+
+def role_service(role: str):
+    """"storage" for roles/storage.admin; None for primitive and custom roles."""
+    name = role[len("roles/"):] if role.startswith("roles/") else ""
+    return name.split(".", 1)[0] if "." in name else None
+
+# Prompt wording -> permissions. Deliberately small and conservative: a prompt that does not map
+# cleanly produces no permissions, and its policy is left as the model wrote it.
+_BROAD_ASK = re.compile(r"\b(admin|admins|administer|administrator|manage|managing|owner|editor|full|everything)\b|roles/")
+# the keyword pairing cannot tell what is excluded ("view logs but not delete buckets"), so any
+# negation or exclusion leaves the policy to the model
+_EXCLUSION = re.compile(r"\b(not|no|never|nor|without|except|excluding|exclude|excludes|but|unless|neither|"
+                        r"don't|dont|doesn't|doesnt|can't|cant|cannot|shouldn't|shouldnt|mustn't|mustnt|won't|wont)\b")
+# bucket names, emails and ids are not wording: "logs-prod-1" is not about logging
+_IDENTIFIER = re.compile(r"\S*[-_@:0-9]\S*")
+_CLAUSE = re.compile(r"[.;,]|\b(?:and|then|plus|also)\b")
+_ACCESS = re.compile(r"\b(access|get)\b")
+_SERVICES = (
+    (re.compile(r"\b(buckets?|objects?|gcs|cloud storage|storage|files?)\b"), "storage"),
+    (re.compile(r"\b(topics?|subscriptions?|pub/?sub|messages?)\b"), "pubsub"),
+    (re.compile(r"\b(logs?|logging|log entries)\b"), "logging"),
+    (re.compile(r"\b(bigquery|datasets?|tables?)\b"), "bigquery"),
+    (re.compile(r"\b(secrets?|secret manager)\b"), "secretmanager"),
+    (re.compile(r"\b(cloud run|cloudrun)\b"), "run"),
+    (re.compile(r"\b(cloud sql|cloudsql|sql|databases?)\b"), "cloudsql"),
+    (re.compile(r"\b(vms?|virtual machines?|compute engine|gce)\b"), "compute"),
+    (re.compile(r"\b(service accounts?)\b"), "iam"),
+)
+_ACTIONS = {
+    "read": re.compile(r"\b(read|reads|reading|view|viewing|list|download|see|browse|inspect|fetch)\b"),
+    "write": re.compile(r"\b(write|writes|writing|upload|uploads|create|add|put|update|modify|edit|deploy)\b"),
+    "delete": re.compile(r"\b(delete|deletes|remove|removes)\b"),
+    "publish": re.compile(r"\b(publish|publishes|send|push)\b"),
+    "consume": re.compile(r"\b(consume|subscribe|pull|receive)\b"),
+    "query": re.compile(r"\b(query|queries)\b"),
+    "invoke": re.compile(r"\b(invoke|call|trigger)\b"),
+    "connect": re.compile(r"\b(connect)\b"),
+    "ssh": re.compile(r"\b(ssh|log in|login)\b"),
+    "impersonate": re.compile(r"\b(impersonate)\b"),
+}
+_NEEDS = {
+    ("storage", "read"): ("storage.objects.get", "storage.objects.list"),
+    ("storage", "write"): ("storage.objects.create",),
+    ("storage", "delete"): ("storage.objects.delete",),
+    ("pubsub", "publish"): ("pubsub.topics.publish",),
+    ("pubsub", "read"): ("pubsub.subscriptions.consume",),
+    ("pubsub", "consume"): ("pubsub.subscriptions.consume",),
+    ("logging", "read"): ("logging.logEntries.list",),
+    ("logging", "write"): ("logging.logEntries.create",),
+    ("bigquery", "read"): ("bigquery.tables.get", "bigquery.tables.getData", "bigquery.tables.list"),
+    ("bigquery", "write"): ("bigquery.tables.updateData",),
+    ("bigquery", "query"): ("bigquery.jobs.create",),
+    ("secretmanager", "read"): ("secretmanager.versions.access",),
+    ("secretmanager", "write"): ("secretmanager.versions.add",),
+    ("run", "invoke"): ("run.routes.invoke",),
+    ("run", "read"): ("run.services.get", "run.services.list"),
+    ("run", "write"): ("run.services.create", "run.services.update"),
+    ("cloudsql", "connect"): ("cloudsql.instances.connect",),
+    ("cloudsql", "read"): ("cloudsql.instances.get", "cloudsql.instances.list"),
+    ("compute", "read"): ("compute.instances.get", "compute.instances.list"),
+    ("compute", "ssh"): ("compute.instances.osLogin",),
+    ("iam", "impersonate"): ("iam.serviceAccounts.getAccessToken",),
+}
+
+def requested_permissions(prompt: str) -> frozenset:
+    """
+    Permissions a prompt plainly asks for, e.g. "read objects in the bucket and publish to the topic".
+    Actions pair with the services named in the same clause; an action with no service carries over
+    to the next clause that names one ("read and write objects"). Empty when the prompt asks for
+    administrative or full access, excludes anything, or names nothing this table knows.
+    """
+    text = (prompt or "").lower().replace("\u2019", "'")
+    if _BROAD_ASK.search(text) or _EXCLUSION.search(text):
+        return frozenset()
+    text = _IDENTIFIER.sub(" ", text)
+
+    needed = set()
+    pending = set()
+    for clause in _CLAUSE.split(text):
+        actions = {action for action, pattern in _ACTIONS.items() if pattern.search(clause)}
+        if not actions and _ACCESS.search(clause):
+            actions = {"read"}
+        services = [service for pattern, service in _SERVICES if pattern.search(clause)]
+        if not services:
+            pending |= actions
+            continue
+        actions |= pending
+        pending = set()
+        for service in services:
+            for action in actions:
+                needed.update(_NEEDS.get((service, action), ()))
+    return frozenset(needed)
+
+def narrow_policy(policy, prompt: str):
+    """
+    Replaces over-broad roles (primitive and sensitive roles) with the narrowest catalog roles covering
+    what the prompt asks for, splitting a binding when that takes roles from several services.
+    A service role is only narrowed within its own service. Returns (policy, replacements); the
+    policy is returned unchanged when nothing was narrowed. removed_permissions_approx is counted
+    against the bundled catalog, which may list only part of a role's permissions.
+    """
+    if not isinstance(policy, dict) or not isinstance(policy.get("bindings"), list):
+        return policy, []
+    needed = requested_permissions(prompt)
+    if not needed:
+        return policy, []
+
+    roles_catalog = catalog()
+    bindings = []
+    replacements = []
+    for i, binding in enumerate(policy["bindings"]):
+        role = binding.get("role") if isinstance(binding, dict) else None
+        narrower = None
+        if isinstance(role, str) and is_over_broad(role):
+            service = role_service(role)
+            scoped = [p for p in needed if service is None or p.split(".", 1)[0] == service]
+            narrower = roles_catalog.narrower(role, scoped)
+        if not narrower:
+            bindings.append(binding)
+            continue
+        bindings.extend({**binding, "role": name} for name in narrower)
+        granted = 0
+        for name in narrower:
+            granted |= roles_catalog.masks[name]
+        replacements.append({
+            "binding": i,
+            "role": role,
+            "replacements": narrower,
+            "removed_permissions_approx": roles_catalog.masks[role].bit_count() - granted.bit_count(),
+        })
+        metrics.least_privilege_replacements.inc(role)
+
+    if not replacements:
+        return policy, []
+    return {**policy, "bindings": bindings}, replacements
+
+def build_catalog(roles) -> dict:
+    """The role_permissions.json document for IAM Role resources (name, includedPermissions)."""
+    permissions = sorted({p for role in roles for p in role.get("includedPermissions", ())})
+    index = {name: i for i, name in enumerate(permissions)}
+    return {
+        "permissions": permissions,
+        "roles": {
+            role["name"]: sorted(index[p] for p in set(role.get("includedPermissions", ())))
+            for role in sorted(roles, key=lambda role: role["name"])
+        },
+    }
+
+if __name__ == "__main__":
+    from googleapiclient import discovery
+
+    service = discovery.build("iam", "v1", cache_discovery=False)
+    request = service.roles().list(view="FULL", pageSize=1000)
+    roles = []
+    while request is not None:
+        response = request.execute()
+        roles.extend(response.get("roles", []))
+        request = service.roles().list_next(request, response)
+    json.dump(build_catalog(roles), sys.stdout, indent=2)
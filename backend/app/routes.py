@@ -1,19 +1,24 @@
-from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
+import asyncio
 import json
+import os
+import time
 
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-from googleapiclient import discovery
 from googleapiclient.errors import HttpError
-import google.auth
 
+import auth
 import helpers
-
-import os
-
-# Get Google OAuth client ID for token verification
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+import history
+import metrics
+import pipeline
+import project_iam
+import policy_lint
+import project_cache
+import response_cache
+import startup
 
 router = APIRouter()
 
@@ -22,22 +27,32 @@ router = APIRouter()
 class PolicyRequest(BaseModel):
     prompt: str
 
-@router.post("/apply_policy")
-async def apply_policy(request: Request):
-    """
-    Applies a generated policy to a specified Google Cloud project.
-    Handles authentication, merges new policy with existing one, and updates the project.
-    """
-    # Parse the incoming policy payload from request body
-    data = await request.json()
-    policy_str = data.get("policy")
+# Upper bound on unique prompts generated concurrently by /generate_policy/batch
+BATCH_GENERATE_MAX_PARALLEL = int(os.getenv("BATCH_GENERATE_MAX_PARALLEL", "8"))
+BATCH_GENERATE_MAX_PROMPTS = int(os.getenv("BATCH_GENERATE_MAX_PROMPTS", "500"))
+
+# Pydantic model for batch policy generation payload
+class BatchPolicyRequest(BaseModel):
+    prompts: List[str] = Field(min_length=1, max_length=BATCH_GENERATE_MAX_PROMPTS)
+
+# Upper bound on projects updated concurrently by /apply_policy/bulk
+BULK_APPLY_MAX_PARALLEL = int(os.getenv("BULK_APPLY_MAX_PARALLEL", "8"))
+
+# Pydantic model for bulk policy application payload
+class BulkApplyRequest(BaseModel):
+    policy: Union[str, dict]
+    project_ids: List[str]
+    history_id: Optional[int] = None
+
+def _sse(event: str, data) -> str:
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _parse_policy_bindings(policy_str):
+    """Returns the bindings of a policy given as a JSON string or object; 400 on bad input."""
     if not policy_str:
         raise HTTPException(status_code=400, detail="Missing policy payload")
     try:
-        import json
-        # Log the received policy for debugging
-        print(f"Received policy: {policy_str}")
-        
         # Handle case where policy_str is already a JSON object
         if isinstance(policy_str, dict):
             policy_json = policy_str
@@ -45,234 +60,342 @@ async def apply_policy(request: Request):
             policy_json = json.loads(policy_str)
             
         new_policy_bindings = policy_json.get("bindings", [])
-        print(f"Parsed policy bindings: {new_policy_bindings}")
+        # %-style args so large policies are only formatted when debug logging is on
+        helpers.logger.debug("Parsed %d policy bindings", len(new_policy_bindings))
+        return new_policy_bindings
     except Exception as e:
-        print(f"Error parsing policy JSON: {e}")
+        helpers.logger.info("Error parsing policy JSON: %s", e)
         raise HTTPException(status_code=400, detail=f"Invalid policy JSON: {str(e)}")
 
-    # Verify OAuth token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid token")
-    token = auth_header.split("Bearer ")[1]
+async def _lint_or_raise(project_id: str, bindings: list):
+    """Lints conditional bindings against a project; raises HTTPException on lint issues or failures."""
+    # conditions are linted concurrently and memoized
+    full_resource_name = f"//cloudresourcemanager.googleapis.com/projects/{project_id}"
     try:
-        id_token.verify_oauth2_token(token, google_requests.Request(), GOOGLE_CLIENT_ID)
+        lint_issues = await policy_lint.lint_bindings(full_resource_name, bindings)
     except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
+        raise HTTPException(status_code=500, detail=f"Failed to lint policy: {e}")
+
+    if lint_issues:
+        # Convert results into a compact human-readable string expected by the frontend
+        raise HTTPException(status_code=400, detail=policy_lint.format_lint_issues(lint_issues))
+
+async def _record_apply(owner: str, project_id: str, bindings: list, history_id=None):
+    """Links an applied policy to owner's generation history entry; a history failure never fails the apply."""
+    try:
+        await asyncio.to_thread(history.store.mark_applied, owner, project_id, bindings, history_id)
+    except Exception as e:
+        helpers.logger.warning(f"Failed to record apply in history: {str(e)}")
+
+def _owner(claims):
+    """History owner for a generate request: the verified subject, or None when anonymous."""
+    return claims["sub"] if claims else None
+
+def _http_error_message(err: HttpError) -> str:
+    """Concise message for the UI out of a googleapiclient HttpError."""
+    msg = str(err)
+    if 'returned "' in msg:
+        msg = msg.split('returned "')[1].split('".')[0]
+    return msg
+
+@router.post("/apply_policy")
+async def apply_policy(request: Request, claims: dict = Depends(auth.require_claims)):
+    """
+    Applies a generated policy to a specified Google Cloud project.
+    The caller's ID token is verified by the auth.require_claims dependency.
+    Merges new policy with existing one, and updates the project.
+    The apply is recorded against the generation history entry given as "history_id", or else
+    the latest entry with the same bindings.
+    """
+    # Parse the incoming policy payload from request body
+    data = await request.json()
+    new_policy_bindings = _parse_policy_bindings(data.get("policy"))
+
     # Get the project ID from request headers
     PROJECT_ID = request.headers.get("project-id")
     if not PROJECT_ID:
         raise HTTPException(status_code=400, detail="Missing project-id")
 
     # Lint policy before applying
-    credentials, _ = google.auth.default(quota_project_id=None)
-    iam_service = discovery.build("iam", "v1", credentials=credentials, cache_discovery=False)
+    await _lint_or_raise(PROJECT_ID, new_policy_bindings)
+    
+    try:
+        # Indexed, condition-aware merge; re-reads and re-merges on etag conflicts
+        updated_policy, merge_result = await project_iam.apply_bindings(PROJECT_ID, new_policy_bindings)
+        await _record_apply(claims["sub"], PROJECT_ID, new_policy_bindings, data.get("history_id"))
 
-    full_resource_name = f"//cloudresourcemanager.googleapis.com/projects/{PROJECT_ID}"
-    lint_issues = []
+        return {"status": "Policy applied", "updated_policy": updated_policy, "diff": merge_result.diff()}
 
-    for binding in new_policy_bindings:
-        condition = binding.get("condition")
-        if not condition:
-            continue                                     # nothing to lint here
+    except HttpError as err:
+        # surface a concise message back to the UI
+        raise HTTPException(status_code=err.resp.status, detail=_http_error_message(err))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        lint_body = {
-            "fullResourceName": full_resource_name,
-            "condition": condition,
-        }
-        try:
-            lint_resp = iam_service.iamPolicies().lintPolicy(body=lint_body).execute()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to lint policy: {e}")
+@router.post("/apply_policy/preview")
+async def preview_policy(request: Request, claims: dict = Depends(auth.require_claims)):
+    """
+    Dry run of /apply_policy: same payload and project-id header, nothing is written.
+    Returns the bindings the merge would add, those already granted, and those whose members
+    already hold the role under a different condition, plus the resulting policy.
+    The fetched policy is cached per project, so repeated previews and the apply that follows
+    usually skip getIamPolicy; the etag still guards the eventual write.
+    """
+    data = await request.json()
+    new_policy_bindings = _parse_policy_bindings(data.get("policy"))
 
-        lint_results = lint_resp.get("lintResults", [])
-        if lint_results:    
-            print(lint_results)                             # anything other than an empty list
-            lint_issues.extend(lint_results)
+    PROJECT_ID = request.headers.get("project-id")
+    if not PROJECT_ID:
+        raise HTTPException(status_code=400, detail="Missing project-id")
 
-    if lint_issues:
-        # Convert results into a compact human-readable string expected by the frontend
-        pretty = " | ".join(
-            f"[{r.get('severity')}] {r.get('debugMessage')} (field: {r.get('fieldName')})"
-            for r in lint_issues
-        )
-        raise HTTPException(status_code=400, detail=pretty)
-    
-    
-    try:
-        crm_service = discovery.build("cloudresourcemanager", "v1",
-                                      credentials=credentials, cache_discovery=False)
-
-        current_policy = crm_service.projects().getIamPolicy(
-            resource=PROJECT_ID, body={}
-        ).execute()
-
-        # DO NOT OVERWRITE EXISTING BINDINGS, GRAB THE EXISTING ONES FIRST AND MERGE THEM
-        # YOU WILL BRICK THE PROJECT
-        existing_bindings = current_policy.get("bindings", [])
-
-        # merge
-        for new_binding in new_policy_bindings:
-            role = new_binding.get("role")
-            members_to_add = new_binding.get("members", [])
-            for binding in existing_bindings:
-                if binding.get("role") == role:
-                    binding["members"] = list(set(binding.get("members", []) + members_to_add))
-                    break
-            else:
-                existing_bindings.append(new_binding)
-
-        updated_policy_body = current_policy.copy()
-        updated_policy_body["bindings"] = existing_bindings
-
-        updated_policy = crm_service.projects().setIamPolicy(
-            resource=PROJECT_ID,
-            body={"policy": updated_policy_body}
-        ).execute()
-
-        return {"status": "Policy applied", "updated_policy": updated_policy}
+    # a preview that lints clean is one apply will accept
+    await _lint_or_raise(PROJECT_ID, new_policy_bindings)
 
+    try:
+        current_policy, merge_result = await project_iam.preview_bindings(PROJECT_ID, new_policy_bindings)
+        return {
+            "changed": merge_result.changed,
+            "etag": current_policy.get("etag"),
+            "diff": merge_result.diff(),
+            "resulting_policy": merge_result.policy,
+        }
     except HttpError as err:
-        # surface a concise message back to the UI
-        msg = str(err)
-        if 'returned "' in msg:
-            msg = msg.split('returned "')[1].split('".')[0]
-        raise HTTPException(status_code=err.resp.status, detail=msg)
+        raise HTTPException(status_code=err.resp.status, detail=_http_error_message(err))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/apply_policy/bulk")
+async def apply_policy_bulk(request: BulkApplyRequest, claims: dict = Depends(auth.require_claims)):
+    """
+    Applies one policy to many projects.
+    The token is verified and the policy linted once; get-merge-set then runs for every project
+    concurrently (at most BULK_APPLY_MAX_PARALLEL at a time). Each project's outcome is streamed
+    as a server-sent "project" event as soon as it finishes, followed by a "done" summary.
+    A failing project never aborts the others.
+    """
+    new_policy_bindings = _parse_policy_bindings(request.policy)
+    project_ids = list(dict.fromkeys(request.project_ids))
+    if not project_ids:
+        raise HTTPException(status_code=400, detail="Missing project_ids")
+
+    # Lint results depend on the resource type, which is the same for every target project
+    await _lint_or_raise(project_ids[0], new_policy_bindings)
+
+    semaphore = asyncio.Semaphore(BULK_APPLY_MAX_PARALLEL)
+
+    async def apply_one(project_id: str):
+        async with semaphore:
+            try:
+                _, merge_result = await project_iam.apply_bindings(project_id, new_policy_bindings)
+                await _record_apply(claims["sub"], project_id, new_policy_bindings, request.history_id)
+                return {"project_id": project_id, "status": "Policy applied", "diff": merge_result.diff()}
+            except HttpError as err:
+                return {"project_id": project_id, "status": "error",
+                        "status_code": err.resp.status, "detail": _http_error_message(err)}
+            except Exception as e:
+                return {"project_id": project_id, "status": "error", "status_code": 500, "detail": str(e)}
+
+    async def events():
+        tasks = [asyncio.create_task(apply_one(project_id)) for project_id in project_ids]
+        failed = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                failed += result["status"] == "error"
+                yield _sse("project", result)
+            yield _sse("done", {"succeeded": len(tasks) - failed, "failed": failed})
+        finally:
+            # client went away: do not start writes nobody will see the outcome of
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/generate_policy")
-async def generate_policy(request: PolicyRequest):
+async def generate_policy(request: PolicyRequest, claims: Optional[dict] = Depends(auth.optional_claims)):
     """
     Receives a plain English prompt and returns a generated Google Cloud IAM policy.
     Uses a two-model approach for generation and validation.
+    Repeated prompts are answered from the response cache without any model calls.
+    Signed-in callers get their own generation history: reuse, few-shot examples and a history_id.
     """
     try:
         helpers.logger.info(f"Received policy generation request: {request.prompt[:50]}...")
-        
-        # First model call: Generate policy with JSON mode
-        helpers.logger.info("Making initial call to policy generation model")
-        generation_response = await helpers.generate_policy_with_model(request.prompt)
-        
-        # Extract policy and chat response from generation model
-        policy_json = None
-        chat_response = None
-        validated = False
-        
-        if "policy" in generation_response:
-            policy_json = generation_response["policy"]
-            validated = generation_response.get("validate", False)
-        
-        if "chat_response" in generation_response:
-            chat_response = generation_response["chat_response"]
-        
-        policy = json.dumps(policy_json, indent=2) if policy_json else None
-        
-        # If a policy was generated and should be validated
-        validation_feedback = None
-        if policy and validated:
-            helpers.logger.info("Policy generated, validating with second model")
-            validation_result = await helpers.validate_policy_with_model(policy, request.prompt, chat_response)
-            
-            # Preserve the chat_response from validation result if it exists
-            if "chat_response" in validation_result:
-                chat_response = validation_result["chat_response"]
-            
-            # If policy is invalid, send feedback to generation model
-            if not validation_result.get("valid", False):
-                validation_feedback = validation_result.get("feedback", "")
-                helpers.logger.info(f"Validation failed, regenerating with feedback: {validation_feedback[:50]}...")
-                
-                # Second generation with validation feedback
-                regeneration_response = await helpers.regenerate_policy_with_feedback(
-                    request.prompt, 
-                    validation_feedback,
-                    policy,
-                    chat_response
-                )
-                
-                # Update policy and chat response with regenerated values
-                if "policy" in regeneration_response:
-                    policy_json = regeneration_response["policy"]
-                    policy = json.dumps(policy_json, indent=2)
-                
-                if "chat_response" in regeneration_response:
-                    chat_response = regeneration_response["chat_response"]
-                    
-                    # Add validation feedback if not already included
-                    if validation_feedback and validation_feedback not in chat_response:
-                        if chat_response:
-                            chat_response = f"{chat_response}\n\nValidation feedback: {validation_feedback}"
-                        else:
-                            chat_response = f"Validation feedback: {validation_feedback}"
-        
+
+        result, _ = await pipeline.generate_policy_cached(request.prompt, _owner(claims))
+        policy, chat_response = result["policy"], result["chat_response"]
+
         helpers.logger.info(f"Returning response: policy_exists={policy is not None}, chat_response_exists={chat_response is not None}")
-        return {"policy": policy, "chat_response": chat_response}
+        return result
             
     except Exception as e:
         helpers.logger.error(f"Error in generate_policy: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error generating policy: {e}")
 
+@router.post("/generate_policy/batch")
+async def generate_policy_batch(request: BatchPolicyRequest, claims: Optional[dict] = Depends(auth.optional_claims)):
+    """
+    Generates policies for many prompts at once.
+    Identical prompts (after normalization) are generated once; unique prompts run the full
+    generate/validate/regenerate chain concurrently, at most BATCH_GENERATE_MAX_PARALLEL at a time.
+    Results come back in input order with per-item errors, plus batch timing and token usage.
+    """
+    batch_start = time.perf_counter()
+    unique_prompts = {}
+    for prompt in request.prompts:
+        if prompt.strip():
+            unique_prompts.setdefault(response_cache.normalize_prompt(prompt), prompt)
+    helpers.logger.info(f"Received batch of {len(request.prompts)} prompts ({len(unique_prompts)} unique)")
+
+    semaphore = asyncio.Semaphore(BATCH_GENERATE_MAX_PARALLEL)
+    owner = _owner(claims)
+
+    async def run_one(prompt: str):
+        async with semaphore:
+            start = time.perf_counter()
+            with helpers.track_usage() as usage:
+                try:
+                    result, cached = await pipeline.generate_policy_cached(prompt, owner)
+                    item = {**result, "cached": cached}
+                except Exception as e:
+                    helpers.logger.error(f"Error in generate_policy_batch item: {str(e)}", exc_info=True)
+                    item = {"error": f"Error generating policy: {e}"}
+            item["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            return item, usage
+
+    outcomes = await asyncio.gather(*(run_one(prompt) for prompt in unique_prompts.values()))
+    by_prompt = dict(zip(unique_prompts, outcomes))
+
+    total_usage = helpers.TokenUsage()
+    for _, usage in outcomes:
+        total_usage.merge(usage)
+
+    results = []
+    for index, prompt in enumerate(request.prompts):
+        outcome = by_prompt.get(response_cache.normalize_prompt(prompt))
+        item = dict(outcome[0]) if outcome else {"error": "Empty prompt"}
+        results.append({"index": index, "prompt": prompt, **item})
+
+    failed = sum(bool(item.get("error")) for item in results)
+    return {
+        "results": results,
+        "summary": {
+            "total": len(results),
+            "unique": len(unique_prompts),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "cached": sum(outcome[0].get("cached", False) for outcome in outcomes),
+            "elapsed_ms": round((time.perf_counter() - batch_start) * 1000, 1),
+            "usage": total_usage.to_dict(),
+        },
+    }
+
+@router.post("/generate_policy/stream")
+async def generate_policy_stream(request: PolicyRequest, claims: Optional[dict] = Depends(auth.optional_claims)):
+    """
+    Streaming variant of /generate_policy.
+    Emits server-sent events as each stage produces output (see pipeline.policy_pipeline_events),
+    ending with a "result" event carrying the same payload /generate_policy returns, or an "error" event.
+    """
+    helpers.logger.info(f"Received streaming policy generation request: {request.prompt[:50]}...")
+
+    owner = _owner(claims)
+
+    async def events():
+        cached = await response_cache.policy_cache.get_async(request.prompt, owner)
+        if cached is not None:
+            yield _sse("result", cached)
+            return
+        try:
+            async for event, data in pipeline.policy_pipeline_events(request.prompt, stream=True, owner=owner):
+                if event == "result":
+                    await pipeline.cache_result(request.prompt, data, owner)
+                yield _sse(event, data)
+        except Exception as e:
+            helpers.logger.error(f"Error in generate_policy_stream: {str(e)}", exc_info=True)
+            yield _sse("error", {"detail": f"Error generating policy: {e}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # keep proxies from buffering the stream into one late response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/get_projects")
-async def get_projects(request: Request):
+async def get_projects(
+    response: Response,
+    claims: dict = Depends(auth.require_claims),
+    cursor: Optional[str] = Query(None, pattern=r"^\d+$"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    q: Optional[str] = None,
+    refresh: bool = False,
+):
     """
     Returns a list of projects the authenticated user has access to.
-    Verifies the user's token and uses Google Cloud API to fetch projects.
+    The user's token is verified by the auth.require_claims dependency; uses Google Cloud API to fetch projects.
+    Listings are cached per user (see project_cache) and served from an in-memory index:
+    `q` filters by id or name, `limit`/`cursor` page through the matches, `refresh` bypasses the cache.
+    The body stays a plain list; the next page's cursor and the match count are returned in the
+    X-Next-Cursor and X-Total-Count headers.
     """
-    # Verify OAuth token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail=f"Missing or invalid token, Auth Header: {auth_header}, Request Headers: {request.headers}")
-    token = auth_header.split("Bearer ")[1]
     try:
-        # Verify the token is valid
-        id_info = id_token.verify_oauth2_token(token, google_requests.Request(), GOOGLE_CLIENT_ID)
-        if not id_info:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
-    
-    from googleapiclient import discovery
-    from googleapiclient.errors import HttpError
-    import google.auth
-    import google.auth.transport.requests
+        index = await project_cache.project_cache.get(claims["sub"], force_refresh=refresh)
+        projects, next_cursor, total = index.page(cursor, limit, q)
 
-    try:
-        # Use default credentials with Application Default Credentials
-        # Instead of trying to use the ID token as OAuth credentials
-        credentials, project_id = google.auth.default()
-        
-        # Create a request object for the credentials
-        auth_req = google.auth.transport.requests.Request()
-        
-        # Refresh the credentials
-        credentials.refresh(auth_req)
-        
-        # Build the service with these credentials 
-        crm_service = discovery.build(
-            "cloudresourcemanager", 
-            "v1", 
-            credentials=credentials
-        )
-        
-        # Make the list request to get all projects the user has access to
-        request = crm_service.projects().list()
-        projects = []
-
-        # Handle pagination by fetching all pages of results
-        while request is not None:
-            response = request.execute()
-            projects.extend([{"id": project["projectId"], "name": project["name"]} for project in response.get("projects", [])])
-            request = crm_service.projects().list_next(previous_request=request, previous_response=response)
-
-        print(f"Successfully fetched {len(projects)} projects")
+        response.headers["X-Total-Count"] = str(total)
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
         return projects
     except HttpError as err:
         error_detail = f"HttpError: Failed to fetch projects: {err}"
-        print(error_detail)
+        helpers.logger.error(error_detail)
         raise HTTPException(status_code=500, detail=error_detail)
     except Exception as e:
         error_detail = f"An error occurred: {str(e)}"
-        print(error_detail)
-        raise HTTPException(status_code=500, detail=error_detail)
\ No newline at end of file
+        helpers.logger.error(error_detail)
+        raise HTTPException(status_code=500, detail=error_detail)
+
+@router.get("/history")
+async def get_history(
+    response: Response,
+    claims: dict = Depends(auth.require_claims),
+    cursor: Optional[str] = Query(None, pattern=r"^\d+$"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    The caller's past generations, newest first: prompt, final policy, chat response and the projects the policy
+    was applied to. Paged like /get_projects: the body is a plain list, the next page's cursor and the
+    entry count come back in the X-Next-Cursor and X-Total-Count headers.
+    """
+    entries, next_cursor, total = await asyncio.to_thread(history.store.page, claims["sub"], cursor, limit)
+    response.headers["X-Total-Count"] = str(total)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return entries
+
+@router.get("/history/similar")
+async def get_similar_history(
+    prompt: str = Query(..., min_length=1),
+    limit: int = Query(5, ge=1, le=20),
+    claims: dict = Depends(auth.require_claims),
+):
+    """The caller's past generations whose prompts resemble prompt, most similar first, for surfacing while the user types."""
+    return await asyncio.to_thread(
+        history.store.similar, claims["sub"], prompt, limit=limit, threshold=history.HISTORY_FEW_SHOT_THRESHOLD
+    )
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint: per-stage latency, LLM token usage, cache hit rates and in-flight requests."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness probe: 503 until the startup warm-up has finished, then 200. The body is the startup report."""
+    report = startup.report.to_dict()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
@@ -0,0 +1,45 @@
+import asyncio
+
+import metrics
+
+flight_calls = metrics.Counter(
+    "gatekeeper_single_flight_calls_total",
+    "Calls through a single-flight group: leaders ran the upstream call, followers shared a leader's result.",
+    ["flight", "role"],
+)
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight upstream call.
+    The first caller (the leader) starts fn() as a task; callers arriving before it finishes await
+    the same task, so they all get its result or its exception. The task is shielded: a caller that
+    goes away does not cancel the call for the others. Nothing is kept once the call finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    def _forget(self, key, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # every waiter may have gone away; retrieve the exception so asyncio does not warn about it
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn):
+        """Returns the result of fn(), a coroutine function, shared with concurrent calls for key."""
+        task = self._inflight.get(key)
+        # a call left behind by an event loop that has since closed cannot be awaited here
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            self.calls += 1
+            flight_calls.inc(self.name, "leader")
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+            flight_calls.inc(self.name, "follower")
+        return await asyncio.shield(task)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+
+# Standalone logger: importing helpers here would start the clock late
+logger = logging.getLogger(__name__)
+
+class StartupReport:
+    """
+    Import and initialization timings for one process, plus the background warm-up state.
+    The clock starts when this module is imported, which main.py does first.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self._last_mark = self.started
+        self.imports = {}
+        self.warm_up = {}
+        self.pending = set()
+        self.ready = False
+        self.ready_after = None
+
+    def mark(self, name: str):
+        """Records the time since the previous mark (or since the clock started) under name."""
+        now = self._clock()
+        self.imports[name] = now - self._last_mark
+        self._last_mark = now
+
+    async def run_warm_up(self, steps: dict):
+        """
+        Runs every blocking warm-up step in a worker thread, concurrently, then marks the process
+        ready. A failing step is logged and recorded; whatever it was warming is built on first use.
+        """
+        self.pending = set(steps)
+
+        async def run_step(name, fn):
+            start = self._clock()
+            try:
+                await asyncio.to_thread(fn)
+                status = "ok"
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed: {str(e)}")
+                status = "error"
+            self.warm_up[name] = {"seconds": self._clock() - start, "status": status}
+            self.pending.discard(name)
+
+        await asyncio.gather(*(run_step(name, fn) for name, fn in steps.items()))
+        self.ready = True
+        self.ready_after = self._clock() - self.started
+        logger.info(self.summary())
+
+    def summary(self) -> str:
+        imports = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.imports.items())
+        warm_up = ", ".join(
+            f"{name} {step['seconds'] * 1000:.0f}ms" + ("" if step["status"] == "ok" else f" ({step['status']})")
+            for name, step in self.warm_up.items()
+        )
+        return f"Startup: imports [{imports}]; warm-up [{warm_up}]; ready after {self.ready_after:.2f}s"
+
+    def to_dict(self):
+        return {
+            "ready": self.ready,
+            "ready_after_seconds": self.ready_after,
+            "pending": sorted(self.pending),
+            "imports_seconds": dict(self.imports),
+            "warm_up": dict(self.warm_up),
+        }
+
+report = StartupReport()
@@ -0,0 +1,128 @@
+import re
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+class Binding(BaseModel):
+    """
+    Only the shape of a binding; missing or malformed contents (no members, a non-string member,
+    a bad condition) are left to policy_checker, whose feedback drives regeneration.
+    """
+    model_config = ConfigDict(extra="allow")
+
+    role: Optional[Any] = None
+    members: Optional[list] = None
+    condition: Optional[Any] = None
+
+class Policy(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    bindings: List[Binding] = []
+
+class GenerationResponse(BaseModel):
+    """What the generation and regeneration prompts ask the model for."""
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    policy: Optional[Policy] = None
+    chat_response: Optional[str] = None
+    # "validate" would shadow BaseModel.validate
+    validate_: bool = Field(False, alias="validate")
+
+class ValidationResponse(BaseModel):
+    """What the validation prompt asks the model for."""
+    model_config = ConfigDict(extra="allow")
+
+    valid: Optional[bool] = None
+    confidence: Optional[float] = None
+    feedback: Optional[str] = None
+    chat_response: Optional[str] = None
+    suggested_fixes: Optional[dict] = None
+
+class OutputError(ValueError):
+    """Model output that is neither valid JSON for its schema nor locally repairable."""
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_CLOSERS = {"{": "}", "[": "]"}
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort local fix-up of almost-JSON, the way the frontend cleans up model output:
+    strips code fences, keeps the outermost object, drops trailing commas and stray closing
+    brackets, and closes an unterminated string and any brackets left open.
+    """
+    text = _FENCE.sub("", text)
+    start = text.find("{")
+    if start == -1:
+        return text.strip()
+    text = text[start:]
+
+    out = []
+    stack = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            if not stack or stack[-1] != char:
+                continue                                # stray closer
+            stack.pop()
+            _drop_trailing_comma(out)
+        out.append(char)
+        if not stack:
+            break                                       # outermost object is complete; drop what follows
+
+    if in_string:
+        out.append('"')
+    while stack:
+        _drop_trailing_comma(out)
+        out.append(stack.pop())
+    return "".join(out)
+
+def _drop_trailing_comma(out: list):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+def parse(text: str, schema: type):
+    """
+    Parses model output into a schema instance with pydantic's JSON parser, retrying once on the
+    locally repaired text. Returns (instance, repaired); raises OutputError when both fail.
+    """
+    text = text or ""
+    try:
+        return schema.model_validate_json(text), False
+    except ValidationError as e:
+        first_error = e
+    repaired = repair_json(text)
+    try:
+        return schema.model_validate_json(repaired), True
+    except ValidationError as e:
+        # the repaired text's error is more useful when the original was not even JSON
+        error = e if _is_json_error(first_error) else first_error
+        raise OutputError(_describe(error)) from error
+
+def _is_json_error(error: ValidationError) -> bool:
+    return any(item["type"] == "json_invalid" for item in error.errors())
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'document'}: {item['msg']}"
+        for item in error.errors()[:5]
+    )
+
+def to_dict(instance: BaseModel) -> dict:
+    """Back to the plain dict the pipeline works with, keeping only the keys the model sent."""
+    return instance.model_dump(by_alias=True, exclude_unset=True)
@@ -0,0 +1,192 @@
+"""
+Offline load test of the hot HTTP paths against local Groq and Google stand-ins (bench/fake_servers.py).
+Reports requests/sec and p50/p95/p99 latency for /generate_policy, /apply_policy and /get_projects
+at each concurrency level, and fails when a run regresses against a saved baseline.
+
+    python bench/bench_load.py [--endpoints generate,apply,projects] [--concurrency 1,8,32]
+        [--requests 200] [--groq latency=0.3,jitter=0.1] [--google latency=0.05,error_rate=0.01]
+        [--json results.json] [--baseline baseline.json --max-regression 0.25]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_servers import FakeGoogle, FakeGroq, Profile
+
+BENCH_CLIENT_ID = "bench-client-id.apps.googleusercontent.com"
+
+def percentile(samples, p: float):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(1, math.ceil(p / 100.0 * len(ordered))) - 1]
+
+def summarize(endpoint: str, concurrency: int, latencies, errors: int, elapsed: float) -> dict:
+    result = {"endpoint": endpoint, "concurrency": concurrency, "requests": len(latencies) + errors,
+              "errors": errors, "rps": (len(latencies) + errors) / elapsed if elapsed else 0.0}
+    for p in (50, 95, 99):
+        result[f"p{p}_ms"] = percentile(latencies, p) * 1000 if latencies else None
+    return result
+
+def compare(results, baseline, max_regression: float):
+    """Returns a message per (endpoint, concurrency) whose p95 or throughput regressed past the bound."""
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["endpoint"], result["concurrency"]))
+        if before is None or result["p95_ms"] is None or before["p95_ms"] is None:
+            continue
+        label = f"{result['endpoint']} @ {result['concurrency']}"
+        if result["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{label}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result["rps"] < before["rps"] * (1 - max_regression):
+            regressions.append(f"{label}: {before['rps']:.1f} -> {result['rps']:.1f} req/s")
+    return regressions
+
+def start_fakes(groq_profile: Profile, google_profile: Profile, n_projects: int):
+    """Starts both fake servers and points the backend at them through its environment."""
+    import prompts
+    groq = FakeGroq(groq_profile, validation_prompt=prompts.VALIDATION_SYSTEM_PROMPT).start()
+    google = FakeGoogle(google_profile, n_projects=n_projects).start()
+    os.environ.update({
+        "GROQ_BASE_URL": groq.url,
+        "GROQ_API_KEY": "bench-key",
+        "GOOGLE_API_ENDPOINT": google.url,
+        "GOOGLE_CERTS_URL": f"{google.url}/oauth2/v1/certs",
+        "GOOGLE_CLIENT_ID": BENCH_CLIENT_ID,
+    })
+    # hedging would send traffic to the real OpenAI API
+    os.environ.pop("OPENAI_API_KEY", None)
+    return groq, google
+
+class Workload:
+    """Builds the request for the i-th call to each endpoint."""
+
+    def __init__(self, tokens, n_projects: int, run_id: str):
+        self.tokens = tokens
+        self.n_projects = n_projects
+        self.run_id = run_id
+
+    def _auth(self, i: int):
+        return {"Authorization": f"Bearer {self.tokens[i % len(self.tokens)]}"}
+
+    def generate(self, client, i: int):
+        # unique prompts, so every call runs the full pipeline instead of hitting the response cache
+        prompt = f"Give user{i}@example.com read access to bucket logs-{self.run_id}-{i}"
+        return client.post("/generate_policy", json={"prompt": prompt})
+
+    def apply(self, client, i: int):
+        # unique conditions, so every call is linted
+        policy = {"bindings": [{
+            "role": "roles/storage.objectViewer",
+            "members": [f"user:user{i}@example.com"],
+            "condition": {"title": f"bench-{self.run_id}-{i}",
+                          "expression": f"request.time < timestamp('2030-01-01T00:00:{i % 60:02d}Z')"},
+        }]}
+        headers = {**self._auth(i), "project-id": f"bench-project-{i % self.n_projects}"}
+        return client.post("/apply_policy", json={"policy": policy}, headers=headers)
+
+    def projects(self, client, i: int):
+        return client.get("/get_projects", params={"limit": 50}, headers=self._auth(i))
+
+async def run_level(client, request, n_requests: int, concurrency: int):
+    latencies, errors = [], 0
+    counter = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await request(client, i)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+async def run(args, google):
+    # imported only now: the backend reads the fake endpoints from the environment at import time
+    from httpx import ASGITransport, AsyncClient
+    from google.oauth2.credentials import Credentials
+    import google_clients
+    from main import app
+
+    # a static token stands in for ADC; it is only ever sent to the fake server
+    google_clients.pool = google_clients.GoogleClientPool(credentials=Credentials(token="bench-token"))
+
+    tokens = [google.sign_id_token(f"bench-user-{u}", BENCH_CLIENT_ID) for u in range(args.users)]
+    results = []
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                workload = Workload(tokens, args.projects, run_id=f"{endpoint}{concurrency}-{time.time_ns()}")
+                request = getattr(workload, endpoint)
+                await run_level(client, request, args.warmup, min(concurrency, max(args.warmup, 1)))
+                latencies, errors, elapsed = await run_level(client, request, args.requests, concurrency)
+                results.append(summarize(endpoint, concurrency, latencies, errors, elapsed))
+                print_row(results[-1])
+    return results
+
+def print_row(result):
+    def ms(value):
+        return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+    print(f"{result['endpoint']:<10} {result['concurrency']:>5} {result['requests']:>7} {result['errors']:>7} "
+          f"{result['rps']:>9.1f} {ms(result['p50_ms'])} {ms(result['p95_ms'])} {ms(result['p99_ms'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=["generate", "apply", "projects"])
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint and level")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before each level")
+    parser.add_argument("--users", type=int, default=20, help="distinct signed-in users")
+    parser.add_argument("--projects", type=int, default=50, help="projects served by the fake CRM")
+    parser.add_argument("--groq", type=Profile.parse, default=Profile(latency=0.3, jitter=0.1),
+                        help='fake Groq profile, e.g. "latency=0.3,jitter=0.1,error_rate=0.02,error_status=429"')
+    parser.add_argument("--google", type=Profile.parse, default=Profile(latency=0.05, jitter=0.02),
+                        help="fake CRM/IAM profile, same fields as --groq")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed relative p95 increase / throughput drop against the baseline")
+    args = parser.parse_args()
+    unknown = set(args.endpoints) - {"generate", "apply", "projects"}
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    groq, google = start_fakes(args.groq, args.google, args.projects)
+    print(f"{'endpoint':<10} {'conc':>5} {'reqs':>7} {'errors':>7} {'req/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    try:
+        results = asyncio.run(run(args, google))
+    finally:
+        groq.stop()
+        google.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmarks policy_merge.merge_policy on synthetic policies near the 1,500-binding limit.
+
+    python bench/bench_merge.py [--bindings 1500] [--new 200] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from policy_merge import merge_policy
+
+def synthetic_policy(n_bindings: int, members_per_binding: int = 20, conditional_every: int = 5):
+    """A policy with n_bindings distinct (role, condition) pairs; every Nth binding is conditional."""
+    bindings = []
+    for i in range(n_bindings):
+        binding = {
+            "role": f"roles/service{i % 300}.role{i // 300}",
+            "members": [f"user:u{i}-{j}@example.com" for j in range(members_per_binding)],
+        }
+        if i % conditional_every == 0:
+            binding["condition"] = {"title": f"c{i}", "expression": f"request.time < timestamp('2030-01-{1 + i % 28:02d}T00:00:00Z')"}
+        bindings.append(binding)
+    return {"version": 3, "etag": "BwX", "bindings": bindings}
+
+def synthetic_bindings(policy: dict, n_new: int):
+    """Half the new bindings extend existing ones, half create new (role, condition) pairs."""
+    existing = policy["bindings"]
+    new = []
+    for i in range(n_new):
+        if i % 2:
+            target = existing[(i * 7) % len(existing)]
+            binding = {k: v for k, v in target.items() if k != "members"}
+            binding["members"] = [target["members"][0], f"user:new{i}@example.com"]
+        else:
+            binding = {"role": f"roles/fresh.role{i}", "members": [f"group:g{i}@example.com"]}
+        new.append(binding)
+    return new
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bindings", type=int, default=1500)
+    parser.add_argument("--new", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    policy = synthetic_policy(args.bindings)
+    new_bindings = synthetic_bindings(policy, args.new)
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = merge_policy(policy, new_bindings)
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    print(f"merge_policy: {args.bindings} existing bindings, {args.new} new, {args.repeat} runs")
+    print(f"  added={len(result.added)} unchanged={len(result.unchanged)}")
+    print(f"  min={timings[0] * 1000:.2f}ms median={timings[len(timings) // 2] * 1000:.2f}ms max={timings[-1] * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Local stand-ins for the Groq chat-completions API and the Google endpoints the backend calls
+(Cloud Resource Manager getIamPolicy/setIamPolicy/projects.list, IAM lintPolicy and the OAuth
+signing certs), with configurable latency and error profiles. Used by bench/bench_load.py.
+"""
+import collections
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import rsa
+from google.auth import crypt, jwt
+
+# Roles the fake model picks from: the local checker settles most, roles/viewer goes to the validation model
+_ROLES = ("roles/storage.objectViewer", "roles/pubsub.publisher", "roles/logging.viewer", "roles/viewer")
+
+@dataclass
+class Profile:
+    """Latency and error behaviour of a fake server."""
+    latency: float = 0.0        # base seconds per request
+    jitter: float = 0.0         # uniform +/- spread around latency
+    tail_rate: float = 0.0      # fraction of requests that take tail_latency instead
+    tail_latency: float = 0.0
+    error_rate: float = 0.0     # fraction of requests answered with error_status
+    error_status: int = 500
+
+    @classmethod
+    def parse(cls, spec: str):
+        """Builds a profile from "latency=0.3,jitter=0.1,error_rate=0.01"."""
+        profile = cls()
+        for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+            name, _, value = item.partition("=")
+            if name not in cls.__dataclass_fields__:
+                raise ValueError(f"Unknown profile field: {name}")
+            setattr(profile, name, type(getattr(profile, name))(value))
+        return profile
+
+    def delay(self, rng: random.Random) -> float:
+        if self.tail_rate and rng.random() < self.tail_rate:
+            return self.tail_latency
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def fails(self, rng: random.Random) -> bool:
+        return bool(self.error_rate) and rng.random() < self.error_rate
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, like the real APIs; every response carries a Content-Length
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _handle(self, method: str):
+        server = self.server
+        url = urlparse(self.path)
+        body = self._read_json() if method == "POST" else None
+        with server.lock:
+            server.requests += 1
+            delay = server.profile.delay(server.rng)
+            fails = server.profile.fails(server.rng)
+        time.sleep(delay)
+        if fails:
+            status = server.profile.error_status
+            headers = {"retry-after": "1"} if status == 429 else None
+            return self._send_json(status, server.error_body(status), headers)
+        route = server.route(method, url.path)
+        if route is None:
+            return self._send_json(404, server.error_body(404))
+        handler, params = route
+        with server.lock:
+            server.calls[handler.__name__] += 1
+        status, response = handler(body=body, query=parse_qs(url.query), **params)
+        self._send_json(status, response)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+class _FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    routes = ()
+
+    def __init__(self, profile: Profile = None, port: int = 0, seed: int = 0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.profile = profile or Profile()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        # successful routing per handler name, e.g. calls["set_iam_policy"]
+        self.calls = collections.Counter()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def route(self, method: str, path: str):
+        for route_method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                return getattr(self, name), match.groupdict()
+        return None
+
+    def error_body(self, status: int) -> dict:
+        return {"error": {"code": status, "message": f"fake error {status}"}}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class FakeGroq(_FakeServer):
+    """OpenAI-compatible /openai/v1/chat/completions answering with policy-shaped JSON."""
+    routes = (("POST", r"/openai/v1/chat/completions", "chat_completions"),)
+
+    def __init__(self, profile: Profile = None, port: int = 0, seed: int = 0, validation_prompt: str = None):
+        super().__init__(profile, port, seed)
+        self.validation_prompt = validation_prompt
+
+    def chat_completions(self, body, query):
+        messages = body.get("messages", [])
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+        if self.validation_prompt is not None and system == self.validation_prompt:
+            content = {"valid": True}
+        else:
+            with self.lock:
+                role = self.rng.choice(_ROLES)
+            member = f"user:{uuid.uuid5(uuid.NAMESPACE_URL, user).hex[:12]}@example.com"
+            content = {
+                "policy": {"bindings": [{"role": role, "members": [member]}]},
+                "chat_response": "Here is a least-privilege policy for your request.",
+                "validate": True,
+            }
+        text = json.dumps(content)
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(text) // 4
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+class FakeGoogle(_FakeServer):
+    """
+    Cloud Resource Manager v1 and IAM v1 paths under one root URL (GOOGLE_API_ENDPOINT), plus a
+    certs endpoint (GOOGLE_CERTS_URL) for ID tokens minted by sign_id_token(). IAM policies are
+    kept per project and setIamPolicy enforces the etag, so concurrent applies see real 409s.
+    """
+    routes = (
+        ("GET", r"/oauth2/v1/certs", "certs"),
+        ("GET", r"/v1/projects", "list_projects"),
+        ("POST", r"/v1/projects/(?P<project_id>[^/:]+):getIamPolicy", "get_iam_policy"),
+        ("POST", r"/v1/projects/(?P<project_id>[^/:]+):setIamPolicy", "set_iam_policy"),
+        ("POST", r"/v1/iamPolicies:lintPolicy", "lint_policy"),
+    )
+
+    KEY_ID = "bench-key"
+
+    def __init__(self, profile: Profile = None, port: int = 0, seed: int = 0, n_projects: int = 200,
+                 page_size: int = 100, key_bits: int = 2048):
+        super().__init__(profile, port, seed)
+        self.n_projects = n_projects
+        self.page_size = page_size
+        self.policies = {}
+        public_key, private_key = rsa.newkeys(key_bits)
+        self._public_pem = public_key.save_pkcs1().decode()
+        self._signer = crypt.RSASigner.from_string(private_key.save_pkcs1(), self.KEY_ID)
+
+    def error_body(self, status: int) -> dict:
+        statuses = {404: "NOT_FOUND", 409: "ABORTED", 429: "RESOURCE_EXHAUSTED"}
+        return {"error": {"code": status, "message": f"fake error {status}", "status": statuses.get(status, "INTERNAL")}}
+
+    def sign_id_token(self, sub: str, audience: str, lifetime: int = 3600) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com", "aud": audience, "sub": sub,
+            "email": f"{sub}@example.com", "iat": now, "exp": now + lifetime,
+        }
+        return jwt.encode(self._signer, payload).decode()
+
+    def certs(self, body, query):
+        return 200, {self.KEY_ID: self._public_pem}
+
+    def list_projects(self, body, query):
+        start = int(query.get("pageToken", ["0"])[0])
+        end = min(start + self.page_size, self.n_projects)
+        response = {"projects": [
+            {"projectId": f"bench-project-{i}", "name": f"Bench Project {i}"} for i in range(start, end)
+        ]}
+        if end < self.n_projects:
+            response["nextPageToken"] = str(end)
+        return 200, response
+
+    def _policy(self, project_id: str):
+        return self.policies.setdefault(project_id, {
+            "version": 1,
+            "etag": "BwAAAAAAAAA=",
+            "bindings": [{"role": "roles/owner", "members": ["user:owner@example.com"]}],
+        })
+
+    def get_iam_policy(self, body, query, project_id):
+        with self.lock:
+            return 200, json.loads(json.dumps(self._policy(project_id)))
+
+    def set_iam_policy(self, body, query, project_id):
+        policy = body.get("policy", {})
+        with self.lock:
+            current = self._policy(project_id)
+            if policy.get("etag") and policy["etag"] != current["etag"]:
+                return 409, self.error_body(409)
+            policy["etag"] = uuid.uuid4().hex[:12]
+            self.policies[project_id] = policy
+            return 200, policy
+
+    def lint_policy(self, body, query):
+        return 200, {}
@@ -1,12 +1,83 @@
+import json
+import os
+import sys
+from types import SimpleNamespace as NS
+
 import pytest
 from httpx import AsyncClient, ASGITransport
+
+# app/ modules import each other as top-level modules (``import helpers``)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+# the Groq client refuses to build without a key; tests never hit the network
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+# no OpenAI key: requests are never hedged to a real provider
+os.environ.pop("OPENAI_API_KEY", None)
+# generation history stays in memory instead of a file in the working directory
+os.environ["HISTORY_PATH"] = ":memory:"
+
 from app.main import app
 
 import pytest_asyncio
 
+def fake_groq_resp(content, usage: tuple = None):
+    """
+    A chat completion shaped like the Groq SDK's, with attribute access:
+    {"choices": [{"message": {"content": ...}}], "usage": {...}}. Non-string content is sent as JSON;
+    usage is (prompt_tokens, completion_tokens).
+    """
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    response = NS(choices=[NS(message=NS(content=content))])
+    if usage is not None:
+        response.usage = NS(prompt_tokens=usage[0], completion_tokens=usage[1])
+    return response
+
+def parse_sse(body: str):
+    """[(event, data), ...] from a text/event-stream body."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
 @pytest_asyncio.fixture
 async def client():
     """AsyncClient bound to the FastAPI ASGI app (httpx ≥0.28 style)."""
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
-        yield ac
\ No newline at end of file
+        yield ac
+
+@pytest.fixture(autouse=True)
+def _reset_policy_cache():
+    """Keeps cached generations from leaking between tests."""
+    import response_cache
+    response_cache.policy_cache.clear()
+    yield
+    response_cache.policy_cache.clear()
+
+@pytest.fixture(autouse=True)
+def _reset_iam_policy_cache():
+    """Each test starts without cached project IAM policies."""
+    import project_iam
+    project_iam.clear_policy_cache()
+    yield
+    project_iam.clear_policy_cache()
+
+@pytest.fixture(autouse=True)
+def _reset_history():
+    """Each test starts with an empty generation history."""
+    import history
+    history.store.clear()
+    yield
+    history.store.clear()
+
+@pytest.fixture
+def signed_in():
+    """Skips ID-token verification for endpoints guarded by auth.require_claims or auth.optional_claims."""
+    import auth
+    claims = {"sub": "test-user", "email": "tester@example.com"}
+    app.dependency_overrides[auth.require_claims] = lambda: claims
+    app.dependency_overrides[auth.optional_claims] = lambda: claims
+    yield claims
+    app.dependency_overrides.pop(auth.require_claims, None)
+    app.dependency_overrides.pop(auth.optional_claims, None)
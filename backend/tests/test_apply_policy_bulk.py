@@ -0,0 +1,36 @@
+import asyncio, json, pytest
+from types import SimpleNamespace as NS
+
+from googleapiclient.errors import HttpError
+
+import policy_lint
+import project_iam
+from policy_merge import MergeResult
+from tests.conftest import parse_sse
+
+@pytest.mark.asyncio
+async def test_bulk_apply_streams_each_project_and_isolates_failures(client, signed_in, monkeypatch):
+    lint_calls = []
+
+    async def fake_lint(resource, bindings):
+        lint_calls.append(resource)
+        return []
+
+    async def fake_apply(project_id, bindings):
+        await asyncio.sleep({"slow": 0.1, "fast": 0.0, "broken": 0.05}[project_id])
+        if project_id == "broken":
+            raise HttpError(NS(status=403, reason="denied"), b"{}")
+        return {}, MergeResult({}, bindings, [])
+
+    monkeypatch.setattr(policy_lint, "lint_bindings", fake_lint)
+    monkeypatch.setattr(project_iam, "apply_bindings", fake_apply)
+
+    policy = {"bindings": [{"role": "roles/viewer", "members": ["user:a@example.com"]}]}
+    resp = await client.post("/apply_policy/bulk", json={"policy": policy, "project_ids": ["slow", "fast", "broken", "fast"]})
+    events = parse_sse(resp.text)
+
+    # results arrive in completion order, duplicates collapsed, one lint for the whole batch
+    assert [d["project_id"] for e, d in events if e == "project"] == ["fast", "broken", "slow"]
+    assert events[1][1]["status_code"] == 403
+    assert events[-1] == ("done", {"succeeded": 2, "failed": 1})
+    assert len(lint_calls) == 1
@@ -0,0 +1,71 @@
+import os, sys, pytest
+
+from google.oauth2.credentials import Credentials
+
+import google_clients
+import policy_lint
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bench"))
+from fake_servers import FakeGoogle
+
+COND = {"title": "expires", "expression": "request.time < timestamp('2030-01-01T00:00:00Z')"}
+
+@pytest.fixture
+def fake_google(monkeypatch):
+    server = FakeGoogle(key_bits=512).start()
+    pool = google_clients.GoogleClientPool(credentials=Credentials(token="t"), api_endpoint=server.url)
+    monkeypatch.setattr(google_clients, "pool", pool)
+
+    async def no_lint_issues(resource, bindings):
+        return []
+
+    monkeypatch.setattr(policy_lint, "lint_bindings", no_lint_issues)
+    yield server
+    server.stop()
+
+def post(client, path, bindings, project="p1"):
+    return client.post(path, json={"policy": {"bindings": bindings}}, headers={"project-id": project})
+
+@pytest.mark.asyncio
+async def test_preview_is_cached_and_apply_reuses_it(client, signed_in, fake_google):
+    binding = {"role": "roles/viewer", "members": ["user:a@x.com"]}
+
+    first = await post(client, "/apply_policy/preview", [binding])
+    second = await post(client, "/apply_policy/preview", [binding])
+    assert first.status_code == second.status_code == 200
+    assert first.json()["diff"]["added"] == [binding]
+    assert first.json()["changed"] is True
+    assert fake_google.calls["get_iam_policy"] == 1
+    assert fake_google.calls["set_iam_policy"] == 0
+
+    applied = await post(client, "/apply_policy", [binding])
+    assert applied.status_code == 200
+    # the previewed policy's etag was still current: one write, no re-read
+    assert fake_google.calls["get_iam_policy"] == 1
+    assert fake_google.calls["set_iam_policy"] == 1
+
+    after = await post(client, "/apply_policy/preview", [binding])
+    assert after.json()["changed"] is False
+    assert after.json()["diff"]["unchanged"] == [binding]
+
+@pytest.mark.asyncio
+async def test_apply_on_stale_cache_rereads_after_conflict(client, signed_in, fake_google):
+    await post(client, "/apply_policy/preview", [{"role": "roles/viewer", "members": ["user:a@x.com"]}])
+    # someone else writes the policy after our preview
+    fake_google.policies["p1"] = {**fake_google.policies["p1"], "etag": "changed-elsewhere"}
+
+    applied = await post(client, "/apply_policy", [{"role": "roles/viewer", "members": ["user:a@x.com"]}])
+    assert applied.status_code == 200
+    assert fake_google.calls["set_iam_policy"] == 2      # 409 on the cached etag, then success
+    assert fake_google.calls["get_iam_policy"] == 2
+
+@pytest.mark.asyncio
+async def test_preview_reports_grants_under_another_condition(client, signed_in, fake_google):
+    fake_google.policies["p1"] = {"version": 3, "etag": "e1", "bindings": [
+        {"role": "roles/viewer", "members": ["user:a@x.com"], "condition": COND},
+    ]}
+
+    resp = await post(client, "/apply_policy/preview", [{"role": "roles/viewer", "members": ["user:a@x.com", "user:b@x.com"]}])
+    diff = resp.json()["diff"]
+    assert diff["conflicting"] == [{"role": "roles/viewer", "members": ["user:a@x.com"], "existing_condition": COND}]
+    assert diff["added"] == [{"role": "roles/viewer", "members": ["user:a@x.com", "user:b@x.com"]}]
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+import rsa
+from google.auth import crypt, jwt
+
+import auth
+
+AUDIENCE = "client-id"
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class FakeCertCache(auth.CertCache):
+    def __init__(self, certs, clock):
+        super().__init__(url="unused", clock=clock)
+        self.served = certs
+        self.fetches = 0
+
+    def _fetch(self):
+        self.fetches += 1
+        return dict(self.served), 3600
+
+@pytest.fixture(scope="module")
+def keypair():
+    pub, priv = rsa.newkeys(1024)
+    return pub.save_pkcs1().decode(), priv.save_pkcs1().decode()
+
+def make_token(private_pem, kid="k1", exp_in=3600, iss="accounts.google.com"):
+    now = int(time.time())
+    signer = crypt.RSASigner.from_string(private_pem, key_id=kid)
+    payload = {"iss": iss, "aud": AUDIENCE, "sub": "42", "iat": now, "exp": now + exp_in}
+    return jwt.encode(signer, payload).decode()
+
+def test_verified_claims_are_memoized_until_exp(keypair, monkeypatch):
+    public_pem, private_pem = keypair
+    clock = Clock(0)
+    certs = FakeCertCache({"k1": public_pem}, clock)
+    verifier = auth.TokenVerifier(audience=AUDIENCE, certs=certs, clock=clock)
+    token = make_token(private_pem)
+
+    decodes = []
+    real_decode = verifier._decode
+    monkeypatch.setattr(verifier, "_decode", lambda *a: decodes.append(1) or real_decode(*a))
+
+    clock.now = time.time()
+    assert verifier.verify(token)["sub"] == "42"
+    assert verifier.verify(token)["sub"] == "42"
+    assert len(decodes) == 1 and certs.fetches == 1
+
+    # past exp the memoized entry is dropped and the token goes through full verification again
+    clock.now += 7200
+    verifier.verify(token)
+    assert len(decodes) == 2
+
+def test_unknown_key_id_refetches_certs(keypair):
+    public_pem, private_pem = keypair
+    certs = FakeCertCache({"old": public_pem}, Clock(0))
+    verifier = auth.TokenVerifier(audience=AUDIENCE, certs=certs)
+    certs.get()
+    certs.served = {"k1": public_pem}
+
+    assert verifier.verify(make_token(private_pem))["sub"] == "42"
+    assert certs.fetches == 2
+
+def test_wrong_issuer_rejected(keypair):
+    public_pem, private_pem = keypair
+    verifier = auth.TokenVerifier(audience=AUDIENCE, certs=FakeCertCache({"k1": public_pem}, Clock(0)))
+    with pytest.raises(Exception, match="Wrong issuer"):
+        verifier.verify(make_token(private_pem, iss="evil.example.com"))
+
+@pytest.mark.asyncio
+async def test_missing_bearer_token_is_401(client):
+    resp = await client.get("/get_projects")
+    assert resp.status_code == 401
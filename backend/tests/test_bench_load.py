@@ -0,0 +1,56 @@
+import os, sys, pytest
+
+from google.oauth2.credentials import Credentials
+from groq import AsyncGroq
+
+import auth
+import google_clients
+import project_iam
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bench"))
+from bench_load import compare, summarize
+from fake_servers import FakeGoogle, FakeGroq, Profile
+
+@pytest.fixture(scope="module")
+def fake_google():
+    server = FakeGoogle(n_projects=7, page_size=3, key_bits=1024).start()
+    yield server
+    server.stop()
+
+def test_profile_parse():
+    profile = Profile.parse("latency=0.2,error_rate=0.5,error_status=429")
+    assert (profile.latency, profile.error_rate, profile.error_status) == (0.2, 0.5, 429)
+    with pytest.raises(ValueError):
+        Profile.parse("latncy=1")
+
+@pytest.mark.asyncio
+async def test_fake_groq_speaks_chat_completions():
+    server = FakeGroq().start()
+    try:
+        client = AsyncGroq(api_key="k", base_url=server.url, max_retries=0)
+        response = await client.chat.completions.create(
+            model="m", messages=[{"role": "system", "content": "s"}, {"role": "user", "content": "hi"}]
+        )
+        assert '"policy"' in response.choices[0].message.content
+        assert response.usage.completion_tokens > 0
+    finally:
+        server.stop()
+
+@pytest.mark.asyncio
+async def test_pool_endpoint_override_reaches_fake_google(fake_google, monkeypatch):
+    pool = google_clients.GoogleClientPool(credentials=Credentials(token="t"), api_endpoint=fake_google.url)
+    monkeypatch.setattr(google_clients, "pool", pool)
+
+    assert len(await project_iam.list_projects()) == 7     # three pages
+    policy, result = await project_iam.apply_bindings("p1", [{"role": "roles/viewer", "members": ["user:a@x.com"]}])
+    assert result.added and fake_google.policies["p1"]["etag"] == policy["etag"]
+
+def test_fake_certs_verify_signed_tokens(fake_google):
+    verifier = auth.TokenVerifier(audience="aud", certs=auth.CertCache(url=f"{fake_google.url}/oauth2/v1/certs"))
+    assert verifier.verify(fake_google.sign_id_token("u1", "aud"))["sub"] == "u1"
+
+def test_compare_flags_regressions():
+    baseline = [summarize("generate", 8, [0.1] * 100, 0, 1.0)]
+    assert compare([summarize("generate", 8, [0.11] * 100, 0, 1.0)], baseline, 0.25) == []
+    slower = compare([summarize("generate", 8, [0.2] * 100, 0, 2.0)], baseline, 0.25)
+    assert len(slower) == 2    # p95 and throughput
@@ -1,24 +1,40 @@
 # backend/tests/test_generate_policy.py
-import json, pytest
-from types import SimpleNamespace as NS
+import asyncio, json, time, pytest
 
-def fake_groq_resp(text: str):
-    """
-    Build something that looks like:
-       {"choices": [{"message": {"content": text}}]}
-    with attribute access (dot notation) not dicts.
-    """
-    return NS(choices=[NS(message=NS(content=text))])
+import helpers
+from tests.conftest import fake_groq_resp
 
 # ---------------- SUNNY -----------------
 @pytest.mark.asyncio
 async def test_generate_policy_success(client, monkeypatch):
-    payload_json = json.dumps({"bindings": []})
-    monkeypatch.setattr(
-        "app.main.groq_client.chat.completions.create",
-        lambda *a, **k: fake_groq_resp(payload_json),
-    )
+    payload_json = json.dumps({"policy": {"bindings": []}})
+
+    async def fake_create(*a, **k):
+        return fake_groq_resp(payload_json)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
 
     resp = await client.post("/generate_policy", json={"prompt": "dummy"})
     assert resp.status_code == 200
-    assert json.loads(resp.json()["policy"]) == {"bindings": []}
\ No newline at end of file
+    assert json.loads(resp.json()["policy"]) == {"bindings": []}
+
+# ---------------- CONCURRENCY -----------------
+@pytest.mark.asyncio
+async def test_generate_policy_does_not_block_event_loop(client, monkeypatch):
+    payload_json = json.dumps({"policy": {"bindings": []}})
+
+    async def slow_create(*a, **k):
+        await asyncio.sleep(0.2)
+        return fake_groq_resp(payload_json)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", slow_create)
+
+    start = time.perf_counter()
+    resps = await asyncio.gather(
+        *(client.post("/generate_policy", json={"prompt": f"dummy {i}"}) for i in range(5))
+    )
+    elapsed = time.perf_counter() - start
+
+    assert all(r.status_code == 200 for r in resps)
+    # five 200ms calls overlap instead of running back to back
+    assert elapsed < 0.6
@@ -0,0 +1,42 @@
+import json, pytest
+
+import helpers
+import pipeline
+from tests.conftest import fake_groq_resp
+
+@pytest.mark.asyncio
+async def test_batch_dedupes_keeps_order_and_reports_usage(client, monkeypatch):
+    prompts_seen = []
+
+    async def fake_create(*a, **k):
+        prompt = k["messages"][1]["content"]
+        prompts_seen.append(prompt)
+        content = {"policy": {"bindings": [{"role": "roles/viewer", "members": [f"user:{prompt.split()[0]}@x.com"]}]}}
+        return fake_groq_resp(content, usage=(100, 20))
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+
+    real_pipeline = pipeline.run_policy_pipeline
+
+    async def failing_pipeline(prompt, owner=None):
+        if prompt == "fail please":
+            raise ValueError("bad prompt")
+        return await real_pipeline(prompt, owner)
+
+    monkeypatch.setattr(pipeline, "run_policy_pipeline", failing_pipeline)
+
+    prompts = ["alice reads", "bob reads", "Alice reads.", "", "fail please", "alice reads"]
+    resp = await client.post("/generate_policy/batch", json={"prompts": prompts})
+    body = resp.json()
+
+    assert [r["prompt"] for r in body["results"]] == prompts
+    assert sorted(prompts_seen) == ["alice reads", "bob reads"]
+    assert body["results"][0]["policy"] == body["results"][2]["policy"] == body["results"][5]["policy"]
+    assert "bob@x.com" in body["results"][1]["policy"]
+    assert body["results"][3]["error"] == "Empty prompt"
+    assert "bad prompt" in body["results"][4]["error"]
+
+    summary = body["summary"]
+    assert summary["total"] == 6 and summary["unique"] == 3
+    assert summary["succeeded"] == 4 and summary["failed"] == 2
+    assert summary["usage"] == {"calls": 2, "prompt_tokens": 200, "completion_tokens": 40, "total_tokens": 240}
@@ -0,0 +1,40 @@
+import json, pytest
+from types import SimpleNamespace as NS
+
+import helpers
+from tests.conftest import fake_groq_resp, parse_sse
+
+async def fake_stream(text: str, size: int = 7):
+    for i in range(0, len(text), size):
+        yield NS(choices=[NS(delta=NS(content=text[i:i + size]))])
+
+@pytest.mark.asyncio
+async def test_stream_emits_each_stage(client, monkeypatch):
+    draft = {"policy": {"bindings": [{"role": "roles/editor", "members": ["user:a@x.com"]}]}, "validate": True}
+    fixed = {"policy": {"bindings": [{"role": "roles/viewer", "members": ["user:a@x.com"]}]}}
+    verdict = {"valid": False, "feedback": "editor is too broad"}
+    stream_outputs = [json.dumps(draft), json.dumps(fixed)]
+
+    async def fake_create(*a, stream=False, **k):
+        if stream:
+            return fake_stream(stream_outputs.pop(0))
+        return fake_groq_resp(verdict)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+
+    resp = await client.post("/generate_policy/stream", json={"prompt": "let a read things"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(resp.text)
+    names = [name for name, _ in events]
+    assert names[0] == "token"
+    assert names.index("draft") < names.index("validating") < names.index("validation") < names.index("regenerating")
+    assert names[-1] == "result"
+
+    generated = "".join(d["delta"] for n, d in events if n == "token" and d["stage"] == "generate")
+    assert json.loads(generated) == draft
+    validation = events[names.index("validation")][1]
+    assert validation["valid"] is False and validation["source"] == "model"
+    assert validation["feedback"].startswith("editor is too broad")
+    assert json.loads(events[-1][1]["policy"]) == fixed["policy"]
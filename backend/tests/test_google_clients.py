@@ -0,0 +1,41 @@
+import datetime
+from types import SimpleNamespace as NS
+
+import google.auth
+from googleapiclient import discovery
+
+import google_clients
+
+class FakeCredentials:
+    def __init__(self):
+        self.token = None
+        self.expiry = None
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+def test_pool_builds_once_and_refreshes_near_expiry(monkeypatch):
+    creds = FakeCredentials()
+    builds = []
+    monkeypatch.setattr(google.auth, "default", lambda scopes=None: (creds, "proj"))
+
+    def fake_build(name, version, **kwargs):
+        builds.append((name, version, kwargs["static_discovery"]))
+        return NS(close=lambda: None)
+
+    monkeypatch.setattr(discovery, "build", fake_build)
+
+    pool = google_clients.GoogleClientPool()
+    assert pool.crm() is pool.crm()
+    pool.iam()
+    assert builds == [("cloudresourcemanager", "v1", True), ("iam", "v1", True)]
+    assert creds.refreshes == 1
+
+    # token about to expire: the next access refreshes it once
+    creds.expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=1)
+    pool.credentials()
+    pool.credentials()
+    assert creds.refreshes == 2
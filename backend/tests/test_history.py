@@ -0,0 +1,183 @@
+import json, pytest
+
+import helpers
+import policy_lint
+import project_iam
+from history import HistoryStore, MinHasher
+from policy_merge import MergeResult
+from tests.conftest import fake_groq_resp
+
+def policy_text(role, member="user:a@example.com"):
+    return json.dumps({"bindings": [{"role": role, "members": [member]}]}, indent=2)
+
+@pytest.fixture
+def store():
+    return HistoryStore(":memory:")
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher()
+    prompt = "give the ci service account read access to the build artifacts bucket"
+    assert hasher.similarity(hasher.signature(prompt), hasher.signature(prompt.upper() + ".")) == 1.0
+    close = hasher.similarity(hasher.signature(prompt), hasher.signature(prompt.replace("ci", "staging")))
+    far = hasher.similarity(hasher.signature(prompt), hasher.signature("let bob publish to the orders topic"))
+    assert close > 0.6 > far
+
+def test_similar_finds_near_variants_through_the_lsh_index(store):
+    first = store.record("alice", "Give the prod service account read access to the reports bucket", policy_text("roles/storage.objectViewer"))
+    store.record("alice", "Let bob publish messages to the orders topic", policy_text("roles/pubsub.publisher"))
+
+    matches = store.similar("alice", "give the staging service account read access to the reports bucket", threshold=0.5)
+    assert [m["id"] for m in matches] == [first]
+    assert 0.5 <= matches[0]["similarity"] < 1.0
+    assert store.similar("alice", "completely unrelated words here", threshold=0.5) == []
+    assert store.similar("bob", "give the staging service account read access to the reports bucket") == []
+
+def test_mark_applied_matches_by_history_id_or_bindings(store):
+    entry = store.record("alice", "read the bucket", policy_text("roles/storage.objectViewer"))
+    bindings = json.loads(policy_text("roles/storage.objectViewer"))["bindings"]
+
+    assert store.mark_applied("alice", "proj-a", [dict(reversed(list(b.items()))) for b in bindings]) == entry
+    assert store.mark_applied("alice", "proj-b", [], history_id=entry) == entry
+    assert store.mark_applied("bob", "proj-x", [], history_id=entry) is None
+    assert store.mark_applied("bob", "proj-x", bindings) is None
+    assert store.mark_applied("alice", "proj-c", [{"role": "roles/owner", "members": []}]) is None
+    assert store.latest_applied("bob", "Read the bucket.") is None
+    applied = store.latest_applied("alice", "Read the bucket.")
+    assert [a["project_id"] for a in applied["applied_to"]] == ["proj-a", "proj-b"]
+
+def test_page_walks_newest_first_and_prunes_oldest():
+    store = HistoryStore(":memory:", max_entries=4)
+    ids = [store.record("alice", f"prompt {i}", policy_text("roles/viewer")) for i in range(6)]
+
+    store.record("bob", "prompt 6", policy_text("roles/viewer"))
+
+    first, cursor, total = store.page("alice", limit=2)
+    second, end, _ = store.page("alice", cursor, limit=2)
+    assert total == 3
+    assert [e["id"] for e in first + second] == ids[:2:-1]
+    assert end is None
+
+@pytest.mark.asyncio
+async def test_similar_prompt_becomes_a_few_shot_example(client, signed_in, monkeypatch):
+    calls = []
+    outputs = [
+        {"policy": {"bindings": [{"role": "roles/storage.objectViewer", "members": ["serviceAccount:prod@p.iam.gserviceaccount.com"]}]}, "validate": True},
+        {"policy": {"bindings": [{"role": "roles/storage.objectViewer", "members": ["serviceAccount:staging@p.iam.gserviceaccount.com"]}]}, "validate": True},
+    ]
+
+    async def fake_create(*a, messages, **k):
+        calls.append(messages)
+        return fake_groq_resp(outputs.pop(0))
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    first = await client.post("/generate_policy", json={"prompt": "Give the prod service account read access to the reports bucket"})
+    second = await client.post("/generate_policy", json={"prompt": "Give the staging service account read access to the reports bucket"})
+
+    assert len(calls[0]) == 2
+    # system, example prompt, example answer, new prompt
+    assert [m["role"] for m in calls[1]] == ["system", "user", "assistant", "user"]
+    assert "prod@p" in calls[1][2]["content"]
+    assert second.json()["history_id"] > first.json()["history_id"]
+
+@pytest.mark.asyncio
+async def test_applied_policy_is_reused_and_listed(client, signed_in, monkeypatch):
+    calls = []
+    generated = {"policy": {"bindings": [{"role": "roles/pubsub.publisher", "members": ["user:bob@example.com"]}]}, "validate": True}
+
+    async def fake_create(*a, **k):
+        calls.append(k)
+        return fake_groq_resp(generated)
+
+    async def fake_lint(resource, bindings):
+        return []
+
+    async def fake_apply(project_id, bindings):
+        return {}, MergeResult({}, bindings, [])
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(policy_lint, "lint_bindings", fake_lint)
+    monkeypatch.setattr(project_iam, "apply_bindings", fake_apply)
+
+    result = (await client.post("/generate_policy", json={"prompt": "let bob publish to the orders topic"})).json()
+    await client.post("/apply_policy", json={"policy": result["policy"]}, headers={"project-id": "proj-1"})
+
+    # a new process would have an empty response cache; history still answers
+    import response_cache
+    response_cache.policy_cache.clear()
+    again = (await client.post("/generate_policy", json={"prompt": "Let Bob publish to the orders topic."})).json()
+    assert len(calls) == 1
+    assert again == result
+
+    resp = await client.get("/history", params={"limit": 1})
+    assert resp.headers["X-Total-Count"] == "1" and "X-Next-Cursor" not in resp.headers
+    assert resp.json()[0]["applied_to"][0]["project_id"] == "proj-1"
+
+@pytest.mark.asyncio
+async def test_history_is_private_to_its_owner(client, signed_in, monkeypatch):
+    calls = []
+    generated = {"policy": {"bindings": [{"role": "roles/pubsub.publisher", "members": ["user:bob@example.com"]}]}, "validate": True}
+
+    async def fake_create(*a, **k):
+        calls.append(k)
+        return fake_groq_resp(generated)
+
+    async def fake_lint(resource, bindings):
+        return []
+
+    async def fake_apply(project_id, bindings):
+        return {}, MergeResult({}, bindings, [])
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(policy_lint, "lint_bindings", fake_lint)
+    monkeypatch.setattr(project_iam, "apply_bindings", fake_apply)
+
+    mine = (await client.post("/generate_policy", json={"prompt": "let bob publish to the orders topic"})).json()
+    await client.post("/apply_policy", json={"policy": mine["policy"], "history_id": mine["history_id"]},
+                      headers={"project-id": "proj-1"})
+
+    import response_cache
+    response_cache.policy_cache.clear()
+    signed_in["sub"] = "someone-else"
+    theirs = (await client.post("/generate_policy", json={"prompt": "Let Bob publish to the orders topic."})).json()
+
+    # no reuse and no few-shot example from another user's entry
+    assert len(calls) == 2
+    assert [m["role"] for m in calls[1]["messages"]] == ["system", "user"]
+    assert [e["id"] for e in (await client.get("/history")).json()] == [theirs["history_id"]]
+    similar = (await client.get("/history/similar", params={"prompt": "let bob publish to the orders topic"})).json()
+    assert [e["id"] for e in similar] == [theirs["history_id"]]
+
+@pytest.mark.asyncio
+async def test_answers_built_from_history_are_not_served_to_others(client, signed_in, monkeypatch):
+    import auth
+    from app.main import app
+    members = iter(["user:alice-secret@corp.com", "user:bob@example.com", "user:anon@example.com"])
+
+    async def fake_create(*a, **k):
+        policy = {"bindings": [{"role": "roles/pubsub.publisher", "members": [next(members)]}]}
+        return fake_groq_resp({"policy": policy, "validate": True})
+
+    async def fake_lint(resource, bindings):
+        return []
+
+    async def fake_apply(project_id, bindings):
+        return {}, MergeResult({}, bindings, [])
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(policy_lint, "lint_bindings", fake_lint)
+    monkeypatch.setattr(project_iam, "apply_bindings", fake_apply)
+
+    prompt = {"prompt": "let the team publish to the orders topic"}
+    alice = (await client.post("/generate_policy", json=prompt)).json()
+    await client.post("/apply_policy", json={"policy": alice["policy"], "history_id": alice["history_id"]},
+                      headers={"project-id": "proj-1"})
+    # alice's next ask is answered from her own history and cache
+    assert (await client.post("/generate_policy", json=prompt)).json()["policy"] == alice["policy"]
+
+    signed_in["sub"] = "bob"
+    bob = (await client.post("/generate_policy", json=prompt)).json()
+    assert "bob@example.com" in bob["policy"] and "alice-secret" not in bob["policy"]
+
+    app.dependency_overrides.pop(auth.optional_claims)
+    anonymous = (await client.post("/generate_policy", json=prompt)).json()
+    assert "anon@example.com" in anonymous["policy"]
@@ -0,0 +1,65 @@
+import asyncio, pytest
+from types import SimpleNamespace as NS
+
+from llm_providers import HedgedRouter, LatencyHistogram, Provider
+
+def fake_client(delay, answer=None, error=None, calls=None):
+    async def create(**kwargs):
+        if calls is not None:
+            calls.append(kwargs)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return answer
+
+    return NS(chat=NS(completions=NS(create=create)))
+
+def test_histogram_percentile():
+    histogram = LatencyHistogram(size=100)
+    assert histogram.percentile(95) is None
+    for ms in range(1, 101):
+        histogram.observe(ms / 1000)
+    assert histogram.percentile(50) == 0.05
+    assert histogram.percentile(95) == 0.095
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    secondary_calls = []
+    router = HedgedRouter(Provider("p", fake_client(0.01, "primary")),
+                          Provider("s", fake_client(0.0, "secondary", calls=secondary_calls)),
+                          default_delay=0.2)
+    assert await router.create(model="m") == "primary"
+    assert secondary_calls == [] and router.hedged == 0
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    secondary_calls = []
+    primary = Provider("p", fake_client(1.0, "primary"))
+    router = HedgedRouter(primary, Provider("s", fake_client(0.01, "secondary", calls=secondary_calls), model="other"),
+                          default_delay=0.05)
+
+    start = asyncio.get_running_loop().time()
+    assert await router.create(model="m", messages=[]) == "secondary"
+    assert asyncio.get_running_loop().time() - start < 0.5
+    assert secondary_calls[0]["model"] == "other"
+    assert router.hedged == 1
+    await asyncio.sleep(0)
+    assert len(primary.latency("m")) == 0        # a cancelled call leaves no sample
+
+@pytest.mark.asyncio
+async def test_failed_hedge_falls_back_to_primary():
+    router = HedgedRouter(Provider("p", fake_client(0.1, "primary")),
+                          Provider("s", fake_client(0.0, error=RuntimeError("down"))),
+                          default_delay=0.01)
+    assert await router.create(model="m") == "primary"
+
+def test_hedge_delay_follows_primary_percentile():
+    primary = Provider("p", None)
+    router = HedgedRouter(primary, Provider("s", None), percentile=90, min_delay=0.1, max_delay=5, default_delay=3)
+    assert router.hedge_delay("small") == 3
+    for i in range(100):
+        primary.latency("small").observe(0.5 if i < 90 else 8.0)
+        primary.latency("large").observe(4.0)
+    assert router.hedge_delay("small") == 0.5
+    assert router.hedge_delay("large") == 4.0
+    assert router.hedge_delay("unseen") == 3
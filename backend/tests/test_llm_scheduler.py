@@ -0,0 +1,87 @@
+import asyncio, pytest
+
+import groq
+import httpx
+
+from llm_scheduler import LLMScheduler, TokenBucket, PRIORITY_FOLLOW_UP, PRIORITY_NEW
+
+def rate_limit_error(retry_after="0.05"):
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return groq.RateLimitError("rate limited", response=response, body=None)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills_over_a_minute():
+    clock = Clock()
+    bucket = TokenBucket(600, clock)
+    bucket.consume(600)
+    assert bucket.wait_time(100) == pytest.approx(10.0)
+    clock.now = 10.0
+    assert bucket.wait_time(100) == 0.0
+    assert TokenBucket(0, clock).wait_time(10 ** 9) == 0.0
+
+@pytest.mark.asyncio
+async def test_follow_up_calls_run_before_new_generations():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        await release.wait()
+
+    async def record(name):
+        order.append(name)
+
+    first = asyncio.create_task(scheduler.submit(blocker, PRIORITY_NEW, 10))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.create_task(scheduler.submit(lambda: record("new"), PRIORITY_NEW, 10)),
+        asyncio.create_task(scheduler.submit(lambda: record("validate"), PRIORITY_FOLLOW_UP, 10)),
+    ]
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(first, *queued)
+    assert order == ["validate", "new"]
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_retried_after_retry_after():
+    scheduler = LLMScheduler(max_retries=2)
+    attempts = []
+
+    async def flaky():
+        attempts.append(asyncio.get_running_loop().time())
+        if len(attempts) == 1:
+            raise rate_limit_error("0.05")
+        return "ok"
+
+    assert await scheduler.submit(flaky, PRIORITY_NEW, 10) == "ok"
+    assert attempts[1] - attempts[0] >= 0.05
+    assert scheduler.rate_limited == 1
+
+@pytest.mark.asyncio
+async def test_rate_limit_surfaces_after_max_retries():
+    scheduler = LLMScheduler(max_retries=1)
+
+    async def always_limited():
+        raise rate_limit_error("0")
+
+    with pytest.raises(groq.RateLimitError):
+        await scheduler.submit(always_limited, PRIORITY_NEW, 10)
+
+@pytest.mark.asyncio
+async def test_requests_per_minute_budget_delays_admission():
+    scheduler = LLMScheduler(rpm=1200)     # one request every 50ms once the burst is spent
+    scheduler.requests.consume(1200)
+
+    async def noop():
+        return None
+
+    start = asyncio.get_running_loop().time()
+    await scheduler.submit(noop, PRIORITY_NEW, 10)
+    assert asyncio.get_running_loop().time() - start >= 0.04
@@ -0,0 +1,59 @@
+# backend/tests/test_metrics.py
+import json, pytest
+
+import helpers
+import metrics
+from tests.conftest import fake_groq_resp
+
+def sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+def test_histogram_renders_cumulative_buckets():
+    h = metrics.Histogram("test_latency_seconds", "test", ["stage"], buckets=(0.1, 1.0))
+    h.observe(0.05, "a")
+    h.observe(0.5, "a")
+    h.observe(5.0, "a")
+    lines = h.render()
+    assert 'test_latency_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{stage="a"} 3' in lines
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_stages_tokens_and_cache(client, monkeypatch):
+    # a non-primitive predefined role settles validation locally, so only the generation call is made
+    payload_json = json.dumps({
+        "policy": {"bindings": [{"role": "roles/storage.objectViewer", "members": ["user:a@example.com"]}]},
+        "validate": True,
+    })
+
+    async def fake_create(*a, **k):
+        return fake_groq_resp(payload_json, usage=(100, 20))
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+
+    before = (await client.get("/metrics")).text
+    for _ in range(2):
+        resp = await client.post("/generate_policy", json={"prompt": "metrics probe"})
+        assert resp.status_code == 200
+
+    resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+
+    def delta(prefix):
+        return sample(text, prefix) - sample(before, prefix)
+
+    # the second request is a cache hit, so only one generation reached the model
+    assert delta('gatekeeper_llm_requests_total{stage="generate",outcome="ok"}') == 1
+    assert delta('gatekeeper_llm_tokens_total{stage="generate",kind="prompt"}') == 100
+    assert delta('gatekeeper_llm_requests_total{stage="validate",outcome="ok"}') == 0
+    assert delta('gatekeeper_stage_duration_seconds_count{stage="validate"}') == 0
+    assert delta('gatekeeper_cache_lookups_total{cache="policy_response",result="hit"}') == 1
+    assert delta('gatekeeper_stage_duration_seconds_count{stage="local_check"}') == 1
+    assert delta('gatekeeper_http_request_duration_seconds_count{route="/generate_policy"}') == 2
+    assert "gatekeeper_llm_calls_in_flight 0" in text
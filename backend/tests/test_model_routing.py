@@ -0,0 +1,64 @@
+import pytest
+
+import helpers
+import model_routing
+from tests.conftest import fake_groq_resp
+
+def test_stage_from_env(monkeypatch):
+    monkeypatch.setenv("LLM_VALIDATE_MODEL", "small")
+    monkeypatch.setenv("LLM_VALIDATE_MAX_TOKENS", "256")
+    stage = model_routing.stage_from_env("validate", "default", temperature=0.3)
+    assert stage.request_args() == {"model": "small", "temperature": 0.3, "max_tokens": 256}
+    assert "max_tokens" not in model_routing.stage_from_env("generate", "big").request_args()
+
+@pytest.mark.parametrize("validation, escalate", [
+    ({"valid": True}, False),
+    ({"valid": True, "confidence": 0.95}, False),
+    ({"valid": True, "confidence": 0.4}, True),
+    ({"valid": False, "feedback": "too broad"}, True),
+    ({"feedback": "no verdict"}, True),
+    (None, True),
+])
+def test_should_escalate(validation, escalate):
+    assert model_routing.should_escalate(validation) is escalate
+
+@pytest.fixture
+def routed(monkeypatch):
+    """Validation on "small", escalation to "big"; records the model of every call."""
+    answers, models = {}, []
+    monkeypatch.setattr(model_routing, "VALIDATE", model_routing.StageModel("small", max_tokens=64))
+    monkeypatch.setattr(model_routing, "VALIDATE_ESCALATION", model_routing.StageModel("big"))
+
+    async def fake_create(*a, **k):
+        models.append(k["model"])
+        answer = answers[k["model"]]
+        if isinstance(answer, Exception):
+            raise answer
+        return fake_groq_resp(answer)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    return answers, models
+
+@pytest.mark.asyncio
+async def test_confident_pass_skips_escalation(routed):
+    answers, models = routed
+    answers["small"] = {"valid": True, "confidence": 0.9}
+    assert (await helpers.validate_policy_with_model("{}", "prompt"))["valid"] is True
+    assert models == ["small"]
+
+@pytest.mark.asyncio
+async def test_rejection_is_confirmed_by_escalation_model(routed):
+    answers, models = routed
+    answers["small"] = {"valid": False, "feedback": "looks wrong"}
+    answers["big"] = {"valid": True, "confidence": 0.9}
+    assert (await helpers.validate_policy_with_model("{}", "prompt"))["valid"] is True
+    assert models == ["small", "big"]
+
+@pytest.mark.asyncio
+async def test_small_model_failure_escalates(routed):
+    answers, models = routed
+    answers["small"] = RuntimeError("model overloaded")
+    answers["big"] = {"valid": False, "feedback": "grants owner"}
+    result = await helpers.validate_policy_with_model("{}", "prompt")
+    assert result == {"valid": False, "feedback": "grants owner"}
+    assert models == ["small", "big"]
@@ -0,0 +1,92 @@
+import json, pytest
+
+import helpers
+from policy_checker import check_policy
+from tests.conftest import fake_groq_resp
+
+def policy(*bindings):
+    return {"bindings": list(bindings)}
+
+def test_clean_policy_is_conclusively_valid():
+    verdict = check_policy(policy(
+        {"role": "roles/storage.objectViewer", "members": ["user:a@example.com", "group:devs@example.com"]},
+        {"role": "roles/pubsub.publisher", "members": ["serviceAccount:ci@proj.iam.gserviceaccount.com"]},
+    ))
+    assert verdict.conclusive and verdict.valid
+
+@pytest.mark.parametrize("bad, fragment", [
+    ({"role": "roles/viewer", "members": ["alice@example.com"]}, "must start with one of"),
+    ({"role": "storage.admin", "members": ["user:a@example.com"]}, "must start with 'roles/'"),
+    ({"role": "roles/owner", "members": ["allUsers"]}, "must not be granted to allUsers"),
+    ({"role": "roles/viewer", "members": ["serviceAccount:ci@example.com"]}, ".gserviceaccount.com"),
+    ({"role": "roles/viewer", "members": []}, "non-empty list"),
+    ({"role": "roles/viewer", "members": ["user:a@example.com"], "condition": {"title": "t"}}, "missing 'expression'"),
+])
+def test_broken_policies_are_conclusively_invalid(bad, fragment):
+    verdict = check_policy(policy(bad))
+    assert verdict.conclusive and not verdict.valid
+    assert fragment in verdict.feedback()
+
+@pytest.mark.parametrize("risky", [
+    {"role": "roles/editor", "members": ["user:a@example.com"]},
+    {"role": "roles/storage.admin", "members": ["user:a@example.com"]},
+    {"role": "roles/made.upRole", "members": ["user:a@example.com"]},
+    {"role": "roles/storage.objectViewer", "members": ["domain:example.com"]},
+])
+def test_risky_policies_are_inconclusive(risky):
+    verdict = check_policy(policy(risky))
+    assert not verdict.conclusive and verdict.to_dict()["valid"] is None
+
+@pytest.mark.parametrize("role", [
+    "roles/compute.instanceAdmin.v1",
+    "roles/compute.osAdminLogin",
+    "roles/iam.serviceAccountUser",
+    "roles/iam.serviceAccountTokenCreator",
+    "roles/iam.serviceAccountCreator",
+    "roles/iam.serviceAccountDeleter",
+    "roles/bigquery.dataOwner",
+    "roles/storage.legacyBucketOwner",
+    "roles/storage.legacyObjectOwner",
+    "roles/datastore.owner",
+    "roles/cloudasset.owner",
+    "roles/certificatemanager.owner",
+    "roles/cloudbuild.workerPoolOwner",
+    "roles/cloudbuild.builds.builder",
+    "roles/resourcemanager.projectDeleter",
+    "roles/resourcemanager.projectMover",
+])
+def test_privilege_escalation_roles_need_the_model(role):
+    verdict = check_policy(policy({"role": role, "members": ["user:a@example.com"]}))
+    assert not verdict.conclusive
+    assert f"{role} is an administrative or privilege-escalation role" in verdict.feedback()
+
+def test_sensitive_roles_are_predefined_and_never_public():
+    from policy_checker import PREDEFINED_ROLES, SENSITIVE_ROLES
+    assert SENSITIVE_ROLES <= PREDEFINED_ROLES
+    verdict = check_policy(policy({"role": "roles/iam.serviceAccountTokenCreator", "members": ["allUsers"]}))
+    assert verdict.conclusive and not verdict.valid
+
+@pytest.mark.asyncio
+async def test_conclusive_local_check_skips_validation_model(client, monkeypatch):
+    generated = {"policy": policy({"role": "roles/viewer", "members": ["bob@example.com"]}), "validate": True}
+    fixed = {"policy": policy({"role": "roles/storage.objectViewer", "members": ["user:bob@example.com"]})}
+    requests = []
+
+    async def fake_create(*a, **k):
+        requests.append(k)
+        content = generated if len(requests) == 1 else fixed
+        return fake_groq_resp(content)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+
+    resp = await client.post("/generate_policy", json={"prompt": "bob reads buckets"})
+    assert json.loads(resp.json()["policy"]) == fixed["policy"]
+
+    # generate + regenerate only; the exact checker error reached the regeneration prompt
+    assert len(requests) == 2
+    assert "'bob@example.com' must start with one of" in requests[1]["messages"][1]["content"]
+
+@pytest.mark.parametrize("role", ["roles/example.dataOwner", "roles/example.owner", "roles/example.admin"])
+def test_unlisted_owner_and_admin_roles_are_caught_by_name(role):
+    from policy_checker import is_sensitive_role
+    assert is_sensitive_role(role)
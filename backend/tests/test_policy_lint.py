@@ -0,0 +1,58 @@
+import asyncio, pytest
+from types import SimpleNamespace as NS
+
+import google_clients
+import policy_lint
+
+RESOURCE = "//cloudresourcemanager.googleapis.com/projects/p1"
+
+def cond(expr):
+    return {"title": expr, "expression": expr}
+
+@pytest.fixture
+def fake_iam(monkeypatch):
+    """Records lintPolicy calls and tracks how many are in flight at once."""
+    state = NS(calls=[], in_flight=0, peak=0)
+
+    def lint_policy(body):
+        return body
+
+    async def execute(body):
+        state.calls.append(body["condition"]["expression"])
+        state.in_flight += 1
+        state.peak = max(state.peak, state.in_flight)
+        await asyncio.sleep(0.05)
+        state.in_flight -= 1
+        expr = body["condition"]["expression"]
+        if expr.startswith("bad"):
+            return {"lintResults": [{"severity": "ERROR", "debugMessage": f"{expr} is bad", "fieldName": "condition.expression"}]}
+        return {}
+
+    fake_service = NS(iamPolicies=lambda: NS(lintPolicy=lint_policy))
+    monkeypatch.setattr(google_clients.pool, "iam", lambda: fake_service)
+    monkeypatch.setattr(google_clients.pool, "execute", execute)
+    policy_lint.clear_cache()
+    yield state
+    policy_lint.clear_cache()
+
+@pytest.mark.asyncio
+async def test_lint_runs_concurrently_and_memoizes(fake_iam, monkeypatch):
+    monkeypatch.setattr(policy_lint, "LINT_MAX_PARALLEL", 4)
+    bindings = [{"role": "roles/viewer", "members": [], "condition": cond(f"ok{i}")} for i in range(10)]
+    bindings.append({"role": "roles/viewer", "members": []})    # unconditional: not linted
+
+    assert await policy_lint.lint_bindings(RESOURCE, bindings) == []
+    assert len(fake_iam.calls) == 10
+    assert fake_iam.peak == 4
+
+    # re-applying the same policy hits the memo for every condition
+    await policy_lint.lint_bindings(RESOURCE, bindings)
+    assert len(fake_iam.calls) == 10
+
+@pytest.mark.asyncio
+async def test_lint_issues_keep_binding_order_and_format(fake_iam):
+    bindings = [{"role": "r", "members": [], "condition": cond(e)} for e in ("bad1", "ok", "bad2")]
+    issues = await policy_lint.lint_bindings(RESOURCE, bindings)
+    assert policy_lint.format_lint_issues(issues) == (
+        "[ERROR] bad1 is bad (field: condition.expression) | [ERROR] bad2 is bad (field: condition.expression)"
+    )
@@ -0,0 +1,95 @@
+import copy, os, sys, pytest
+from types import SimpleNamespace as NS
+
+from googleapiclient.errors import HttpError
+
+from policy_merge import merge_policy, apply_with_retry
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bench"))
+from bench_merge import synthetic_policy, synthetic_bindings
+
+COND = {"title": "expires", "expression": "request.time < timestamp('2030-01-01T00:00:00Z')"}
+
+def test_merge_keeps_member_order_and_dedupes():
+    current = {"etag": "e1", "bindings": [{"role": "roles/viewer", "members": ["user:b@x.com", "user:a@x.com"]}]}
+    snapshot = copy.deepcopy(current)
+
+    result = merge_policy(current, [{"role": "roles/viewer", "members": ["user:a@x.com", "user:c@x.com", "user:c@x.com"]}])
+
+    assert result.policy["bindings"] == [{"role": "roles/viewer", "members": ["user:b@x.com", "user:a@x.com", "user:c@x.com"]}]
+    assert result.added == [{"role": "roles/viewer", "members": ["user:c@x.com"]}]
+    assert result.policy["etag"] == "e1"
+    assert current == snapshot
+
+def test_conditional_grant_is_not_folded_into_unconditional():
+    current = {"bindings": [{"role": "roles/viewer", "members": ["user:a@x.com"]}]}
+    result = merge_policy(current, [{"role": "roles/viewer", "members": ["user:b@x.com"], "condition": COND}])
+
+    assert result.policy["bindings"][0] == {"role": "roles/viewer", "members": ["user:a@x.com"]}
+    assert result.policy["bindings"][1] == {"role": "roles/viewer", "members": ["user:b@x.com"], "condition": COND}
+    assert result.policy["version"] == 3
+
+def test_already_granted_bindings_are_unchanged():
+    binding = {"role": "roles/viewer", "members": ["user:a@x.com"], "condition": COND}
+    result = merge_policy({"bindings": [binding]}, [dict(binding)])
+    assert not result.changed and result.unchanged == [binding]
+
+def test_large_synthetic_policy():
+    policy = synthetic_policy(1500)
+    result = merge_policy(policy, synthetic_bindings(policy, 200))
+    assert len(result.added) == 200
+    assert len(result.policy["bindings"]) == 1600
+
+def http_error(status):
+    return HttpError(NS(status=status, reason="conflict"), b"{}")
+
+@pytest.mark.asyncio
+async def test_apply_retries_on_etag_conflict():
+    reads = [{"etag": "e1", "bindings": []}, {"etag": "e2", "bindings": [{"role": "roles/viewer", "members": ["user:z@x.com"]}]}]
+    writes = []
+
+    async def get_policy():
+        return reads.pop(0)
+
+    async def set_policy(policy):
+        writes.append(policy)
+        if policy["etag"] == "e1":
+            raise http_error(409)
+        return policy
+
+    new = [{"role": "roles/viewer", "members": ["user:a@x.com"]}]
+    updated, result = await apply_with_retry(new, get_policy, set_policy)
+
+    assert [w["etag"] for w in writes] == ["e1", "e2"]
+    assert updated["bindings"] == [{"role": "roles/viewer", "members": ["user:z@x.com", "user:a@x.com"]}]
+
+@pytest.mark.asyncio
+async def test_apply_skips_write_when_nothing_changes():
+    async def get_policy():
+        return {"bindings": [{"role": "roles/viewer", "members": ["user:a@x.com"]}]}
+
+    async def set_policy(policy):
+        raise AssertionError("no write expected")
+
+    _, result = await apply_with_retry([{"role": "roles/viewer", "members": ["user:a@x.com"]}], get_policy, set_policy)
+    assert not result.changed
+
+@pytest.mark.asyncio
+async def test_cached_no_op_is_confirmed_against_live_policy():
+    writes = []
+
+    async def get_cached_policy():
+        return {"etag": "old", "bindings": [{"role": "roles/viewer", "members": ["user:a@x.com"]}]}
+
+    async def get_policy():
+        # the grant was removed after the policy was cached
+        return {"etag": "new", "bindings": []}
+
+    async def set_policy(policy):
+        writes.append(policy)
+        return policy
+
+    _, result = await apply_with_retry([{"role": "roles/viewer", "members": ["user:a@x.com"]}],
+                                       get_policy, set_policy, get_cached_policy=get_cached_policy)
+    assert result.changed
+    assert [w["etag"] for w in writes] == ["new"]
@@ -0,0 +1,80 @@
+import asyncio, pytest
+
+import project_cache
+import project_iam
+
+PROJECTS = [{"id": f"proj-{i:03d}", "name": f"Team {'Alpha' if i % 2 else 'Beta'} {i}"} for i in range(25)]
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate_and_coalescing():
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.01)
+        return list(PROJECTS[:len(fetches)])
+
+    clock = Clock()
+    cache = project_cache.ProjectCache(fetch=fetch, ttl=10, stale_ttl=100, clock=clock)
+
+    first = await asyncio.gather(*(cache.get("u1") for _ in range(5)))
+    assert len(fetches) == 1 and all(index is first[0] for index in first)
+
+    clock.now = 50                               # stale: served at once, refreshed behind the scenes
+    stale = await cache.get("u1")
+    assert len(stale.projects) == 1
+    await asyncio.sleep(0.05)
+    assert len((await cache.get("u1")).projects) == 2
+
+    clock.now = 500                              # expired: the caller waits for a fresh listing
+    assert len((await cache.get("u1")).projects) == 3
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_leaves_the_shared_listing_running():
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return list(PROJECTS)
+
+    cache = project_cache.ProjectCache(fetch=fetch)
+    leaver = asyncio.create_task(cache.get("u1"))
+    stayer = asyncio.create_task(cache.get("u1"))
+    await asyncio.sleep(0)
+    leaver.cancel()
+    assert len((await stayer).projects) == len(PROJECTS)
+
+def test_index_filters_and_pages():
+    index = project_cache.ProjectIndex(PROJECTS, 0)
+    page, cursor, total = index.page(limit=5, query="alpha")
+    assert total == 12 and cursor == "5"
+    assert all("Alpha" in p["name"] for p in page)
+    rest, cursor, _ = index.page(cursor="10", limit=5, query="ALPHA")
+    assert len(rest) == 2 and cursor is None
+
+@pytest.mark.asyncio
+async def test_get_projects_pages_from_cache(client, signed_in, monkeypatch):
+    calls = []
+
+    async def fake_list():
+        calls.append(1)
+        return PROJECTS
+
+    monkeypatch.setattr(project_iam, "list_projects", fake_list)
+    project_cache.project_cache.clear()
+
+    first = await client.get("/get_projects", params={"limit": 10})
+    assert [p["id"] for p in first.json()] == [f"proj-{i:03d}" for i in range(10)]
+    assert first.headers["X-Next-Cursor"] == "10" and first.headers["X-Total-Count"] == "25"
+
+    second = await client.get("/get_projects", params={"limit": 10, "cursor": "20"})
+    assert len(second.json()) == 5 and "X-Next-Cursor" not in second.headers
+
+    assert len((await client.get("/get_projects")).json()) == 25
+    assert len(calls) == 1
+    project_cache.project_cache.clear()
@@ -0,0 +1,105 @@
+import json, pytest
+
+import helpers
+import model_routing
+import prompts
+import response_cache
+from response_cache import MemoryBackend, SQLiteBackend, PolicyResponseCache
+from tests.conftest import fake_groq_resp
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.parametrize("make_backend", [
+    lambda clock, tmp_path: MemoryBackend(2, 60, timer=clock),
+    lambda clock, tmp_path: SQLiteBackend(str(tmp_path / "cache.sqlite3"), 2, 60, clock=clock),
+])
+def test_backend_lru_and_ttl(make_backend, tmp_path):
+    clock = FakeClock()
+    cache = PolicyResponseCache(make_backend(clock, tmp_path))
+
+    cache.set("a", {"policy": "A"})
+    clock.now += 1
+    cache.set("b", {"policy": "B"})
+    clock.now += 1
+    assert cache.get("A.") == {"policy": "A"}   # normalized prompt hits, and refreshes "a"
+    clock.now += 1
+    cache.set("c", {"policy": "C"})             # evicts "b", the least recently used
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"policy": "A"}
+    clock.now += 120
+    assert cache.get("c") is None               # expired
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+def test_key_changes_with_model_and_prompt_version():
+    backend = MemoryBackend(8, 60)
+    base = PolicyResponseCache(backend, model="m1", prompt_version="v1")
+    assert base.key("x") != PolicyResponseCache(backend, model="m2", prompt_version="v1").key("x")
+    assert base.key("x") != PolicyResponseCache(backend, model="m1", prompt_version="v2").key("x")
+
+@pytest.mark.asyncio
+async def test_generate_policy_served_from_cache(client, monkeypatch):
+    calls = []
+
+    async def fake_create(*a, **k):
+        calls.append(k)
+        policy = {"bindings": [{"role": "roles/storage.objectViewer", "members": ["user:bob@example.com"]}]}
+        return fake_groq_resp({"policy": policy, "validate": True})
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+
+    first = await client.post("/generate_policy", json={"prompt": "Give bob read access"})
+    second = await client.post("/generate_policy", json={"prompt": "  give BOB read access. "})
+
+    assert first.json() == second.json()
+    assert len(calls) == 1
+    assert response_cache.policy_cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_results_from_failed_stages_are_not_cached(client, monkeypatch):
+    draft = {"policy": {"bindings": [{"role": "roles/editor", "members": ["user:a@x.com"]}]}, "validate": True}
+    calls = []
+
+    async def fake_create(*a, **k):
+        calls.append(k)
+        if k["messages"][0]["content"] == prompts.GENERATION_SYSTEM_PROMPT and len(calls) % 3 == 1:
+            return fake_groq_resp(draft)
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(model_routing, "VALIDATE_ESCALATION", None)
+
+    first = (await client.post("/generate_policy", json={"prompt": "let a edit things"})).json()
+    assert first["valid"] is False and first["error"] == "validate"
+    assert "roles/editor" in first["policy"]
+
+    await client.post("/generate_policy", json={"prompt": "let a edit things"})
+    # generate, validate, regenerate each time: nothing was replayed from the cache
+    assert len(calls) == 6
+    assert len(response_cache.policy_cache.backend) == 0
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_runs_off_the_event_loop(tmp_path):
+    import threading
+    threads = []
+
+    class RecordingBackend(SQLiteBackend):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, value):
+            threads.append(threading.get_ident())
+            super().set(key, value)
+
+    cache = PolicyResponseCache(RecordingBackend(str(tmp_path / "cache.sqlite3"), 8, 60))
+    await cache.set_async("a", {"policy": "A"}, owner="alice")
+    assert await cache.get_async("a", owner="alice") == {"policy": "A"}
+    assert await cache.get_async("a") is None
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,74 @@
+import asyncio, json, pytest
+
+import helpers
+import single_flight
+from tests.conftest import fake_groq_resp
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call():
+    flight = single_flight.SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": 42}
+
+    results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+    assert calls == [1]
+    assert all(r is results[0] for r in results)
+    assert (flight.calls, flight.coalesced) == (1, 4)
+
+    # finished calls are not remembered
+    await flight.do("k", fetch)
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_cancelled_waiters_do_not_cancel_the_call():
+    flight = single_flight.SingleFlight("test")
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("upstream down")
+
+    waiters = [asyncio.create_task(flight.do("k", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    waiters[0].cancel()
+    release.set()
+
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert all(isinstance(r, RuntimeError) for r in results[1:])
+
+@pytest.mark.asyncio
+async def test_identical_prompts_run_the_pipeline_once(client, monkeypatch):
+    payload_json = json.dumps({"policy": {"bindings": []}})
+    calls = []
+
+    async def slow_create(*a, **k):
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return fake_groq_resp(payload_json)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", slow_create)
+
+    prompts = ["Give Bob viewer", "give bob   viewer.", "GIVE BOB VIEWER"]
+    resps = await asyncio.gather(*(client.post("/generate_policy", json={"prompt": p}) for p in prompts * 2))
+
+    assert all(r.status_code == 200 for r in resps)
+    assert calls == [1]
+
+@pytest.mark.asyncio
+async def test_concurrent_policy_reads_share_one_fetch(monkeypatch):
+    import project_iam
+    fetches = []
+
+    async def fake_fetch(project_id):
+        fetches.append(project_id)
+        await asyncio.sleep(0.05)
+        return {"etag": "e1", "bindings": []}
+
+    monkeypatch.setattr(project_iam, "_fetch_project_policy", fake_fetch)
+    await asyncio.gather(*(project_iam.get_project_policy(p) for p in ["a", "a", "a", "b"]))
+    assert sorted(fetches) == ["a", "b"]
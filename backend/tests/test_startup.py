@@ -0,0 +1,38 @@
+import os, subprocess, sys, pytest
+
+import startup
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "app")
+
+def test_import_does_not_load_sdks_or_build_clients():
+    code = (
+        "import sys, main, helpers\n"
+        "heavy = ['openai', 'groq', 'googleapiclient.discovery', 'google.auth.transport.requests', 'httplib2']\n"
+        "print([m for m in heavy if m in sys.modules], helpers._clients)\n"
+    )
+    env = {**os.environ, "GROQ_API_KEY": "test-key"}
+    out = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[] {}"
+
+@pytest.mark.asyncio
+async def test_ready_reports_warm_up(client, monkeypatch):
+    report = startup.StartupReport()
+    monkeypatch.setattr(startup, "report", report)
+    report.mark("imports")
+
+    resp = await client.get("/ready")
+    assert resp.status_code == 503
+    assert resp.json()["ready"] is False
+
+    def broken():
+        raise RuntimeError("no ADC")
+
+    await report.run_warm_up({"fine": lambda: None, "broken": broken})
+
+    resp = await client.get("/ready")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["pending"] == []
+    assert body["warm_up"]["fine"]["status"] == "ok"
+    assert body["warm_up"]["broken"]["status"] == "error"
+    assert "imports" in body["imports_seconds"]
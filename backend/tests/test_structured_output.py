@@ -0,0 +1,98 @@
+import json, pytest
+
+import helpers
+import prompts
+import structured_output
+from structured_output import GenerationResponse, repair_json
+from tests.conftest import fake_groq_resp
+
+POLICY = {"policy": {"bindings": [{"role": "roles/viewer", "members": ["user:a@x.com"]}]}, "validate": True}
+
+@pytest.mark.parametrize("broken", [
+    "```json\n" + json.dumps(POLICY) + "\n```",
+    "Here is your policy: " + json.dumps(POLICY) + " Let me know!",
+    '{"policy": {"bindings": [{"role": "roles/viewer", "members": ["user:a@x.com",],},],}, "validate": true,}',
+    '{"policy": {"bindings": [{"role": "roles/viewer", "members": ["user:a@x.com"]}]}, "validate": true',
+    '{"policy": {"bindings": [{"role": "roles/viewer", "members": ["user:a@x.com"]}]]}, "validate": true}',
+])
+def test_repair_json(broken):
+    assert json.loads(repair_json(broken)) == POLICY
+
+def test_repair_keeps_brackets_and_commas_inside_strings():
+    text = '{"chat_response": "use [roles/viewer], not {owner},", "validate": false,'
+    assert json.loads(repair_json(text)) == {"chat_response": "use [roles/viewer], not {owner},", "validate": False}
+
+def test_parse_round_trips_only_sent_keys():
+    parsed, repaired = structured_output.parse(json.dumps(POLICY), GenerationResponse)
+    assert not repaired
+    assert structured_output.to_dict(parsed) == POLICY
+
+    parsed, repaired = structured_output.parse(json.dumps(POLICY)[:-1], GenerationResponse)
+    assert repaired and structured_output.to_dict(parsed) == POLICY
+
+def test_schema_errors_are_reported():
+    with pytest.raises(structured_output.OutputError, match="members"):
+        structured_output.parse('{"policy": {"bindings": [{"role": "roles/viewer", "members": "user:a"}]}}', GenerationResponse)
+
+@pytest.mark.asyncio
+async def test_unrepairable_output_gets_a_narrow_fix_call(monkeypatch):
+    requests = []
+
+    async def fake_create(*a, **k):
+        requests.append(k)
+        return fake_groq_resp(POLICY)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+
+    # wrong member type: valid JSON, so only the model can fix it
+    broken = '{"policy": {"bindings": [{"role": "roles/viewer", "members": "user:a@x.com"}]}, "validate": true}'
+    assert await helpers.parse_generation_response(broken) == POLICY
+    assert len(requests) == 1
+    assert requests[0]["messages"][0]["content"] == prompts.JSON_REPAIR_SYSTEM_PROMPT
+
+    # locally repairable output never reaches the model
+    assert await helpers.parse_generation_response("```json\n" + json.dumps(POLICY)) == {**POLICY, "repaired": True}
+    assert len(requests) == 1
+
+@pytest.mark.asyncio
+async def test_incomplete_binding_goes_to_regeneration_with_checker_feedback(client, monkeypatch):
+    calls = []
+    incomplete = {"policy": {"bindings": [{"role": "roles/storage.objectViewer"}]}, "validate": True}
+
+    async def fake_create(*a, **k):
+        calls.append(k)
+        content = incomplete if len(calls) == 1 else POLICY
+        return fake_groq_resp(content)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    resp = await client.post("/generate_policy", json={"prompt": "let a read the bucket"})
+
+    # no repair call: the checker's verdict goes straight to the regeneration
+    assert len(calls) == 2
+    assert calls[1]["messages"][0]["content"] == prompts.GENERATION_SYSTEM_PROMPT
+    assert "'members' must be a non-empty list" in calls[1]["messages"][-1]["content"]
+    assert json.loads(resp.json()["policy"]) == POLICY["policy"]
+
+@pytest.mark.asyncio
+async def test_truncated_completion_is_model_validated_and_not_cached(client, monkeypatch):
+    calls = []
+    # cut off after the first member: the closed-up draft passes every local check
+    truncated = '{"policy": {"bindings": [{"role": "roles/storage.objectViewer", "members": ["user:b@example.com",'
+
+    async def fake_create(*a, **k):
+        calls.append(k)
+        if k["messages"][0]["content"] == prompts.VALIDATION_SYSTEM_PROMPT:
+            answer = {"valid": False, "confidence": 0.9, "feedback": "c@example.com is missing."}
+            return fake_groq_resp(answer)
+        return fake_groq_resp(truncated)
+
+    monkeypatch.setattr(helpers.groq_client.chat.completions, "create", fake_create)
+    first = (await client.post("/generate_policy", json={"prompt": "let b read the bucket"})).json()
+
+    # "validate" was cut off, yet the closed-up draft still went to the validation model
+    assert any(k["messages"][0]["content"] == prompts.VALIDATION_SYSTEM_PROMPT for k in calls)
+    assert first["valid"] is False
+
+    before = len(calls)
+    await client.post("/generate_policy", json={"prompt": "let b read the bucket"})
+    assert len(calls) > before